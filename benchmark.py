@@ -0,0 +1,153 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import pcdcNEW
+import sampledata
+
+# (dancers, dances) instances benchmarked by default
+DEFAULT_SIZES = [(50, 10), (500, 50), (5000, 200), (50000, 1000)]
+RESULTS_JSON = "benchmark_results.json"
+
+def run_pipeline(stage, directory):
+    """Run the pcdcNEW pipeline once on the CSVs in directory, calling each step through stage(name, function, *args)"""
+    dancers, dances, model = stage('load_data', pcdcNEW.load_data, None, directory)
+    excluded_dancers = stage('identify_excluded_dancers', pcdcNEW.identify_excluded_dancers, model)
+    stage('diagnose_feasibility', pcdcNEW.diagnose_feasibility, dancers, dances, model, excluded_dancers)
+    visit_order = list(dancers)
+    for assignment_pass in pcdcNEW.ASSIGNMENT_PASSES:
+        stage(assignment_pass.__name__, assignment_pass, dancers, dances, model, visit_order, excluded_dancers)
+    stage('optimize_assignments', pcdcNEW.optimize_assignments, dancers, dances, model, excluded_dancers)
+    show_order = stage('create_show_order', pcdcNEW.create_show_order, dances, model)
+    stage('save_results', pcdcNEW.save_results, dancers, dances, show_order, model, False, directory)
+    return dancers, dances, model
+
+def time_stages(directory):
+    """Run the pipeline and return the wall time of each stage in seconds"""
+    seconds = {}
+
+    def stage(name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds[name] = time.perf_counter() - start
+        return result
+
+    dancers, dances, model = run_pipeline(stage, directory)
+    return seconds, pcdcNEW.assignment_objective(dancers, dances, model)
+
+def profile_stage_memory(directory):
+    """Run the pipeline under tracemalloc and return each stage's peak allocation in bytes"""
+    peak_bytes = {}
+
+    def stage(name, function, *args):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        result = function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_bytes[name] = peak - before
+        return result
+
+    tracemalloc.start()
+    try:
+        run_pipeline(stage, directory)
+    finally:
+        tracemalloc.stop()
+    return peak_bytes
+
+def benchmark_instance(num_dancers, num_dances, seed=0, repeat=1, memory=True):
+    """Benchmark every pipeline stage on one generated instance
+
+    Timings are the best of `repeat` runs. Memory is measured in a separate
+    run because tracemalloc slows the code it traces.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        sampledata.generate_instance(num_dancers, num_dances,
+                                     os.path.join(directory, pcdcNEW.DANCER_CSV),
+                                     os.path.join(directory, pcdcNEW.CHOREO_CSV), seed=seed)
+        generate_seconds = time.perf_counter() - start
+
+        # The pipeline reads the instance from, and saves its results to, the temporary directory
+        with contextlib.redirect_stdout(io.StringIO()):
+            runs = [time_stages(directory) for _ in range(repeat)]
+            peak_bytes = profile_stage_memory(directory) if memory else {}
+
+    stages = {}
+    for name in runs[0][0]:
+        stages[name] = {'seconds': min(seconds[name] for seconds, _ in runs)}
+        if memory:
+            stages[name]['peak_bytes'] = peak_bytes[name]
+
+    return {
+        'dancers': num_dancers,
+        'dances': num_dances,
+        'seed': seed,
+        'repeat': repeat,
+        'generate_seconds': generate_seconds,
+        'total_seconds': sum(stage['seconds'] for stage in stages.values()),
+        'objective': runs[0][1],
+        'stages': stages
+    }
+
+def git_commit():
+    """Current commit hash, so results can be compared between commits"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_size(size):
+    """Parse a DANCERSxDANCES size such as 5000x200"""
+    try:
+        num_dancers, num_dances = map(int, size.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected DANCERSxDANCES, got '{size}'")
+    return num_dancers, num_dances
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Time and memory-profile each stage of pcdcNEW.py on synthetic instances")
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=DEFAULT_SIZES, metavar='DANCERSxDANCES',
+                        help="instances to benchmark (default: 50x10 500x50 5000x200 50000x1000)")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the generated instances (default: 0)")
+    parser.add_argument('--repeat', type=int, default=1, help="timed runs per instance, best is kept (default: 1)")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc memory run")
+    parser.add_argument('--output', default=RESULTS_JSON, help=f"JSON results file (default: {RESULTS_JSON})")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    results = []
+    for num_dancers, num_dances in args.sizes:
+        print(f"\nBenchmarking {num_dancers} dancers x {num_dances} dances...")
+        result = benchmark_instance(num_dancers, num_dances, seed=args.seed,
+                                    repeat=args.repeat, memory=not args.no_memory)
+        results.append(result)
+        for name, stage in result['stages'].items():
+            memory = f"  peak {stage['peak_bytes'] / 2**20:8.1f} MiB" if 'peak_bytes' in stage else ""
+            print(f"  {name:<26}{stage['seconds']:9.3f} s{memory}")
+        print(f"  {'total':<26}{result['total_seconds']:9.3f} s  (objective {result['objective']})")
+
+    report = {
+        'commit': git_commit(),
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to '{args.output}'")
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,299 @@
+import argparse
+import contextlib
+import copy
+import hashlib
+import heapq
+import importlib.util
+import io
+import json
+import os
+import random
+import time
+import zipfile
+import numpy as np
 import pandas as pd
-from collections import defaultdict, deque
 import networkx as nx
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from scipy import sparse
+from scipy.sparse import csgraph
 
 # File paths
 DANCER_CSV = "./dancer_preferences.csv"
 CHOREO_CSV = "./choreographer_preferences.csv"
 
-def load_data():
-    """Load and parse the CSV files"""
-    dancers_df = pd.read_csv(DANCER_CSV)
-    choreo_df = pd.read_csv(CHOREO_CSV)
+# Parsed CSVs are cached here, keyed by content hash (see load_cached); bump
+# CACHE_VERSION whenever the parsed format changes
+CACHE_DIR = "./.pcdc_cache"
+CACHE_VERSION = "1"
+LAST_RUN_JSON = "last_run.json"
+
+# Optional cross-dance rules (see load_constraints)
+CONSTRAINTS_CSV = "./constraints.csv"
+
+# Experience levels from least to most, matched as words in the Experience column
+EXPERIENCE_LEVELS = ('none', 'beginner', 'intermediate', 'advanced')
+
+# Shows with at most this many dances are ordered exactly (Held-Karp);
+# larger ones use heuristics limited to SHOW_ORDER_TIME_LIMIT seconds
+HELD_KARP_MAX_DANCES = 14
+SHOW_ORDER_TIME_LIMIT = 5.0
+
+# Seconds the rehearsal scheduler spends trying to empty time slots after DSATUR
+REHEARSAL_TIME_LIMIT = 2.0
+
+# Dancers rated 1 by more than this share of choreographers are left out
+EXCLUSION_THRESHOLD = 0.6
+
+# Randomized greedy starts run by the multistart solver
+MULTISTART_STARTS = 8
+
+# Wall-clock budget of the anytime solver, and its first local search slice
+# (each later slice is twice as long) in seconds
+ANYTIME_TIME_LIMIT = 10.0
+ANYTIME_SLICE = 0.5
+
+# Objective weights: a placement is worth the choreographer's rating plus a
+# bonus if the dancer listed the dance, and every dancer placed at least once
+# adds a coverage bonus
+PREFERENCE_BONUS = {'most': 2, 'okay': 1}
+COVERAGE_BONUS = 10
+
+class Dancer:
+    """A dancer's parsed preferences and current dances
     
-    # Parse dancer information first
-    dancers = {}
-    for _, row in dancers_df.iterrows():
-        dancers[str(row['Name'])] = {
-            'experience': row['Experience'],
-            'dances': parse_dance_range(row['Dances']),
-            'most': parse_preference_list(row['Most']),
-            'okay': parse_preference_list(row['Okay']),
-            'no': parse_preference_list(row['No']),
-            'current_dances': []
-        }
+    current_dances is a dict used as an insertion-ordered set (every value is
+    None), so membership checks, counting and removal are all constant-time.
+    dance_bits mirrors it as a bitset of dance ids for the constraint checks.
+    """
+    __slots__ = ('id', 'experience', 'dances', 'most', 'okay', 'no', 'current_dances', 'dance_bits')
+    
+    def __init__(self, dancer_id, experience, dances, most, okay, no):
+        self.id = dancer_id
+        self.experience = experience
+        self.dances = dances
+        self.most = most
+        self.okay = okay
+        self.no = no
+        self.current_dances = {}
+        self.dance_bits = 0
+
+class Dance:
+    """A dance's size range and current dancers (an insertion-ordered set, like Dancer.current_dances)"""
+    __slots__ = ('id', 'max_dancers', 'current_dancers')
+    
+    def __init__(self, dance_id, max_dancers):
+        self.id = dance_id
+        self.max_dancers = max_dancers
+        self.current_dancers = {}
+
+def load_data(cache_dir=CACHE_DIR, directory=None):
+    """Load and parse the CSV files from directory (default: the working directory), reusing cached parses from cache_dir"""
+    def input_path(path):
+        return path if directory is None else os.path.join(directory, path)
     
-    # Get valid dancer set
-    valid_dancers = set(dancers.keys())
+    dancer_table, dancer_digest = load_cached(input_path(DANCER_CSV), 'dancers', parse_dancer_csv, cache_dir)
+    dance_table, dance_digest = load_cached(input_path(CHOREO_CSV), 'dances', parse_choreo_csv, cache_dir)
+    
+    # Map dancer and dance names to integer ids (rows/columns of the matrices)
+    dancer_names = pd.Index(dancer_table['names'])
+    dance_names = pd.Index(dance_table['names'])
+    dancer_list = dancer_table['names'].tolist()
+    dance_list = dance_table['names'].tolist()
+    dancer_ids = {dancer: i for i, dancer in enumerate(dancer_list)}
+    dance_ids = {dance: j for j, dance in enumerate(dance_list)}
+    
+    # Build the preference masks from the (dancer row, dance name) tables
+    masks = {}
+    for key in ('most', 'okay', 'no'):
+        rows, items = dancer_table[f'{key}_rows'], dancer_table[f'{key}_items']
+        codes = dance_names.get_indexer(items)
+        known = codes >= 0
+        masks[key] = np.zeros((len(dancer_names), len(dance_names)), dtype=bool)
+        masks[key][rows[known], codes[known]] = True
+    
+    # Build the rating matrix from the (dance row, dancer name, rating) table,
+    # filtering out invalid dancers. Go from 1 up to 5 so a dancer listed twice
+    # keeps their highest rating
+    ratings = np.zeros((len(dancer_names), len(dance_names)), dtype=np.int8)
+    rows, rated, values = dance_table['rating_rows'], dance_table['rating_dancers'], dance_table['rating_values']
+    codes = dancer_names.get_indexer(rated)
+    known = codes >= 0
+    for rating in range(1, 6):
+        selected = known & (values == rating)
+        ratings[codes[selected], rows[selected]] = rating
+    warn_unknown_dancers(pd.DataFrame({'Dance': dance_table['names'][rows[~known]],
+                                       'Dancer': rated[~known],
+                                       'Rating': values[~known]}))
+    
+    # Parse dancer information
+    lists = {key: group_by_row(dancer_table[f'{key}_rows'], dancer_table[f'{key}_items'])
+             for key in ('most', 'okay', 'no')}
+    dancers = {}
+    for i, (dancer, experience, dance_range) in enumerate(zip(
+            dancer_list, dancer_table['experience'].tolist(), dancer_table['dance_ranges'].tolist())):
+        dancers[dancer] = Dancer(i, experience, tuple(dance_range), lists['most'].get(i, []),
+                                 lists['okay'].get(i, []), lists['no'].get(i, []))
     
-    # Parse choreographer information, filtering out invalid dancers
+    # Parse choreographer information
     dances = {}
-    for _, row in choreo_df.iterrows():
-        ratings_dict = {}
-        for rating in range(1, 6):
-            # Filter out any dancers that aren't in our dancer list
-            rated_dancers = parse_preference_list(row[f'Rating_{rating}'])
-            ratings_dict[rating] = [d for d in rated_dancers if d in valid_dancers]
-            
-            # Print warning about invalid dancers
-            invalid_dancers = [d for d in rated_dancers if d not in valid_dancers]
-            if invalid_dancers:
-                print(f"Warning: Dance '{row['Dance']}' rated unknown dancer(s) {invalid_dancers} as {rating}")
-        
-        dances[str(row['Dance'])] = {
-            'max_dancers': parse_num_dancers(str(row['NumDancers'])),
-            'ratings': ratings_dict,
-            'current_dancers': []
-        }
+    for j, (dance, max_dancers) in enumerate(zip(dance_list, dance_table['max_dancers'].tolist())):
+        dances[dance] = Dance(j, tuple(max_dancers))
+    
+    model = {
+        'dancer_names': dancer_list,
+        'dance_names': dance_list,
+        'dancer_ids': dancer_ids,
+        'dance_ids': dance_ids,
+        'ratings': ratings,
+        'most': masks['most'],
+        'okay': masks['okay'],
+        'no': masks['no'],
+        'experience_levels': dancer_table['experience_levels'],
+        'constraints': load_constraints(dance_ids, input_path(CONSTRAINTS_CSV)),
+        'input_digests': {'dancers': dancer_digest, 'dances': dance_digest}
+    }
+    
+    return dancers, dances, model
+
+def parse_dancer_csv(path):
+    """Parse the dancer CSV into a table of arrays, independent of the dance list
+    
+    Preference lists are kept as (dancer row, dance name) pairs so they can
+    be matched against whichever dances the choreographer CSV defines.
+    """
+    dancers_df, dancer_names = intern_rows(pd.read_csv(path), 'Name')
+    experience = dancers_df['Experience'].fillna('').astype(str)
+    table = {
+        'names': np.array(dancer_names, dtype=str),
+        'experience': experience.to_numpy(dtype=str),
+        'experience_levels': np.array(map_unique(experience, parse_experience), dtype=np.int8),
+        'dance_ranges': np.array(map_unique(dancers_df['Dances'], parse_dance_range), dtype=np.int32).reshape(-1, 2)
+    }
+    for key in ('most', 'okay', 'no'):
+        items = explode_list_column(dancers_df[key.capitalize()])
+        table[f'{key}_rows'] = items.index.to_numpy(dtype=np.int32)
+        table[f'{key}_items'] = items.to_numpy(dtype=str)
+    return table
+
+def parse_choreo_csv(path):
+    """Parse the choreographer CSV into a table of arrays, independent of the dancer list
+    
+    Ratings are kept as (dance row, dancer name, rating) triples so they can
+    be matched against whichever dancers the dancer CSV defines.
+    """
+    choreo_df, dance_names = intern_rows(pd.read_csv(path), 'Dance')
+    rated = [explode_list_column(choreo_df[f'Rating_{rating}']) for rating in range(1, 6)]
+    return {
+        'names': np.array(dance_names, dtype=str),
+        'max_dancers': np.array(map_unique(choreo_df['NumDancers'].astype(str), parse_num_dancers),
+                                dtype=np.int32).reshape(-1, 2),
+        'rating_rows': np.concatenate([items.index.to_numpy(dtype=np.int32) for items in rated]),
+        'rating_dancers': np.concatenate([items.to_numpy(dtype=str) for items in rated]),
+        'rating_values': np.concatenate([np.full(len(items), rating, dtype=np.int8)
+                                         for rating, items in enumerate(rated, start=1)])
+    }
+
+def load_cached(path, kind, parse, cache_dir):
+    """Return parse(path) and the file's content hash, reusing the copy cached under that hash
+    
+    The hash is None when cache_dir is None.
+    """
+    if cache_dir is None:
+        return parse(path), None
+    
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(CACHE_VERSION.encode() + f.read()).hexdigest()[:32]
+    table = read_cached_table(cache_dir, kind, digest)
+    if table is not None:
+        return table, digest
+    
+    table = parse(path)
+    cache_path = os.path.join(cache_dir, f'{kind}-{digest}.npz')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary name first so a half-written file is never loaded
+        temp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, **table)
+        os.replace(temp_path, cache_path)
+        # Drop stale entries of the same kind
+        keep = {f'{kind}-{digest}.npz', f'{kind}-{read_last_run(cache_dir).get(kind)}.npz'}
+        for name in os.listdir(cache_dir):
+            if name.startswith(f'{kind}-') and name.endswith('.npz') and name not in keep:
+                os.remove(os.path.join(cache_dir, name))
+    except OSError as e:
+        print(f"Warning: Could not write the parse cache ({e}); continuing without it")
+    return table, digest
+
+def read_cached_table(cache_dir, kind, digest):
+    """Load a cached parse by its content hash, or None if it is missing or unreadable"""
+    try:
+        with np.load(os.path.join(cache_dir, f'{kind}-{digest}.npz'), allow_pickle=False) as cached:
+            return {key: cached[key] for key in cached.files}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+def read_last_run(cache_dir):
+    """Content hashes of the inputs of the last saved run ({} if there is no record)"""
+    try:
+        with open(os.path.join(cache_dir, LAST_RUN_JSON)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def record_last_run(cache_dir, digests):
+    """Remember which inputs the saved assignments were made from"""
+    try:
+        with open(os.path.join(cache_dir, LAST_RUN_JSON), 'w') as f:
+            json.dump(digests, f)
+    except OSError as e:
+        print(f"Warning: Could not record the run in the parse cache ({e})")
+
+def intern_rows(df, column):
+    """Key rows by the string form of a name column
     
-    return dancers, dances
+    Returns the rows in order of each name's first appearance, one per name
+    (a repeated name keeps the values of its last row, as a dict keyed by
+    name would) and renumbered 0..n-1, along with the names themselves.
+    """
+    names = df[column].astype(str)
+    _, uniques = pd.factorize(names)
+    df = df.assign(**{column: names}).drop_duplicates(column, keep='last')
+    df = df.set_index(column).loc[uniques].reset_index()
+    return df, pd.Index(uniques)
+
+def explode_list_column(series):
+    """Split a column of comma-separated lists into one stripped item per row
+    
+    Matches parse_preference_list: empty cells give no items and blank items
+    are dropped. The result is indexed by the row each item came from.
+    """
+    items = series.dropna().astype(str).str.split(',').explode().str.strip()
+    return items[items != '']
+
+def group_by_row(rows, values):
+    """Collect exploded (row, item) pairs back into {row: [items]} in their original order"""
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.array([], dtype=int)
+    ends = np.r_[starts[1:], len(rows)]
+    values = values.tolist()
+    return {row: values[start:end] for row, start, end in zip(rows[starts].tolist(), starts.tolist(), ends.tolist())}
+
+def map_unique(series, parse):
+    """Apply a parse function once per distinct value of a column"""
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    parsed = [parse(value) for value in uniques]
+    return [parsed[code] for code in codes]
+
+def warn_unknown_dancers(unknown):
+    """Print one summary of rating entries naming dancers missing from the dancer list"""
+    if unknown.empty:
+        return
+    print(f"Warning: {len(unknown)} rating(s) name dancers missing from the dancer preferences and were ignored:")
+    for dancer, rows in unknown.groupby('Dancer', sort=False):
+        rated = ', '.join(f"'{dance}' as {rating}" for dance, rating in zip(rows['Dance'], rows['Rating']))
+        print(f"- {dancer}: rated by {rated}")
 
 def parse_dance_range(range_str):
     """Convert dance range string to min-max tuple"""
@@ -62,256 +309,2000 @@ def parse_dance_range(range_str):
 def parse_num_dancers(num_str):
     """Convert number of dancers string to min-max tuple"""
     try:
-        if '-' in num_str:
-            # Handle range format (e.g., "10-14")
-            min_val, max_val = map(int, num_str.split('-'))
-            return (min_val, max_val)
-        elif ',' in num_str:
-            # Handle options format (e.g., "3,5")
-            options = [int(x.strip()) for x in num_str.split(',')]
-            return (min(options), max(options))
-        else:
-            # Handle single number
-            val = int(num_str)
-            return (val, val)
+        return read_num_dancers(num_str)
     except (ValueError, TypeError):
         return (1, 1)  # Default fallback
 
+def read_num_dancers(num_str):
+    """Convert number of dancers string to min-max tuple, raising ValueError if it is not one"""
+    if '-' in num_str:
+        # Handle range format (e.g., "10-14")
+        min_val, max_val = map(int, num_str.split('-'))
+        return (min_val, max_val)
+    elif ',' in num_str:
+        # Handle options format (e.g., "3,5")
+        options = [int(x.strip()) for x in num_str.split(',')]
+        return (min(options), max(options))
+    else:
+        # Handle single number
+        val = int(num_str)
+        return (val, val)
+
 def parse_preference_list(value):
     """Parse a preference list, handling empty/NaN values"""
     if pd.isna(value) or value == '':
         return []
     return [str(x.strip()) for x in str(value).split(',') if x.strip()]
 
-def get_dancer_rating(dancer, dance, dances):
+def parse_experience(value):
+    """Rank a free-text experience value by the highest level it mentions (0 = none)"""
+    text = str(value).lower()
+    for level in range(len(EXPERIENCE_LEVELS) - 1, 0, -1):
+        if EXPERIENCE_LEVELS[level] in text:
+            return level
+    return 0
+
+def load_constraints(dance_ids, path):
+    """Load the constraints CSV (if there is one) and compile it into per-dance bitmasks"""
+    num_dances = len(dance_ids)
+    constraints = {
+        'conflicts': [0] * num_dances,          # dances a member of dance j may not join
+        'requires': [0] * num_dances,           # dances a dancer must be in before joining j
+        'required_by': [0] * num_dances,        # dances that require j, so their members cannot leave j
+        'act_limits': [[] for _ in range(num_dances)],  # (mask, limit) of each act containing j
+        'min_experience': np.zeros(num_dances, dtype=np.int8),
+        'groups': []                            # (dance ids, capacity) of exclusive groups and acts
+    }
+    if not os.path.exists(path):
+        return constraints
+    
+    unknown = []
+    # Value is optional: only act_limit and min_experience rows use it
+    rules = pd.read_csv(path).reindex(columns=['Rule', 'Dances', 'Value'])
+    for rule, dance_list, value in rules.itertuples(index=False):
+        rule = str(rule).strip().lower()
+        names = parse_preference_list(dance_list)
+        unknown += [d for d in names if d not in dance_ids]
+        ids = list(dict.fromkeys(dance_ids[d] for d in names if d in dance_ids))
+        mask = sum(1 << j for j in ids)
+        
+        if rule == 'exclusive':
+            for j in ids:
+                constraints['conflicts'][j] |= mask & ~(1 << j)
+            constraints['groups'].append((ids, 1))
+        elif rule == 'requires':
+            if names and names[0] in dance_ids:
+                first = dance_ids[names[0]]
+                constraints['requires'][first] |= mask & ~(1 << first)
+                for j in ids:
+                    if j != first:
+                        constraints['required_by'][j] |= 1 << first
+        elif rule == 'act_limit':
+            try:
+                limit = int(value)
+            except (TypeError, ValueError):
+                print(f"Warning: act_limit row for '{dance_list}' in {path} has no whole-number Value "
+                      f"({value!r}) and was ignored")
+                continue
+            for j in ids:
+                constraints['act_limits'][j].append((mask, limit))
+            constraints['groups'].append((ids, limit))
+        elif rule == 'min_experience':
+            level = parse_experience(value)
+            for j in ids:
+                constraints['min_experience'][j] = max(constraints['min_experience'][j], level)
+        else:
+            print(f"Warning: Unknown constraint rule '{rule}' in {path} was ignored")
+    
+    if unknown:
+        print(f"Warning: Constraints name unknown dance(s) {sorted(set(unknown))}, which were ignored")
+    return constraints
+
+def get_dancer_rating(dancer, dance, model):
     """Get choreographer's rating for a dancer"""
-    for rating in range(5, 0, -1):
-        if dancer in dances[dance]['ratings'][rating]:
-            return rating
-    return 0  # Not rated
+    return int(model['ratings'][model['dancer_ids'][dancer], model['dance_ids'][dance]])
 
-def can_add_dancer(dancer, dance, dancers, dances):
+def can_add_dancer(dancer, dance, dancers, dances, model):
     """Check if a dancer can be added to a dance"""
     # Check if dancer is already in the dance
-    if dancer in dances[dance]['current_dancers']:
+    if dance in dancers[dancer].current_dances:
         return False
         
     # Check if dance is in do-not-want list
-    if dance in dancers[dancer]['no']:
+    if model['no'][dancers[dancer].id, dances[dance].id]:
         return False
         
     # Check if dance is full
-    current_dancers = len(dances[dance]['current_dancers'])
-    max_dancers_range = dances[dance]['max_dancers']
+    current_dancers = len(dances[dance].current_dancers)
+    max_dancers_range = dances[dance].max_dancers
     if current_dancers >= max_dancers_range[1]:  # Use upper bound of range
         return False
     
     # Check if dancer has reached their maximum
-    current_count = len(dancers[dancer]['current_dances'])
-    max_dances = dancers[dancer]['dances'][1]
+    current_count = len(dancers[dancer].current_dances)
+    max_dances = dancers[dancer].dances[1]
     if current_count >= max_dances:
         return False
 
-    # Prevent dancers from being in both '只此青绿' and '玉鸟'
-    if dance in ['只此青绿', '玉鸟']:
-        other_dance = '玉鸟' if dance == '只此青绿' else '只此青绿'
-        if other_dance in dancers[dancer]['current_dances']:
+    # Check the compiled constraints (see load_constraints)
+    constraints = model['constraints']
+    bits = dancers[dancer].dance_bits
+    j = dances[dance].id
+    if bits & constraints['conflicts'][j]:
+        return False
+    if bits & constraints['requires'][j] != constraints['requires'][j]:
+        return False
+    for mask, limit in constraints['act_limits'][j]:
+        if bin(bits & mask).count('1') >= limit:
             return False
+    if constraints['min_experience'][j] and model['experience_levels'][dancers[dancer].id] < constraints['min_experience'][j]:
+        return False
 
     return True
 
-def identify_excluded_dancers(dances):
-    """Identify dancers that are rated 1 by more than 60% of choreographers"""
-    total_dances = len(dances)
-    threshold = 0.6 * total_dances
+def can_remove_dancer(dancer, dance, dancers, dances, model):
+    """Check if a dancer can leave a dance without breaking a 'requires' rule of another of their dances"""
+    return not dancers[dancer].dance_bits & model['constraints']['required_by'][dances[dance].id]
+
+# Reasons rejection_reason can give, in the order can_add_dancer checks them
+REJECTION_REASONS = ('already_in_dance', 'no_list', 'dance_full', 'dancer_at_max',
+                     'exclusive', 'requires', 'act_limit', 'min_experience')
+
+def rejection_reason(dancer, dance, dancers, dances, model):
+    """Name the first can_add_dancer check a placement fails (None if it passes)
+    
+    Only used by the instrumentation, so can_add_dancer itself stays a plain
+    boolean check; keep the two in the same order.
+    """
+    if dance in dancers[dancer].current_dances:
+        return 'already_in_dance'
+    if model['no'][dancers[dancer].id, dances[dance].id]:
+        return 'no_list'
+    if len(dances[dance].current_dancers) >= dances[dance].max_dancers[1]:
+        return 'dance_full'
+    if len(dancers[dancer].current_dances) >= dancers[dancer].dances[1]:
+        return 'dancer_at_max'
+    constraints = model['constraints']
+    bits = dancers[dancer].dance_bits
+    j = dances[dance].id
+    if bits & constraints['conflicts'][j]:
+        return 'exclusive'
+    if bits & constraints['requires'][j] != constraints['requires'][j]:
+        return 'requires'
+    if any(bin(bits & mask).count('1') >= limit for mask, limit in constraints['act_limits'][j]):
+        return 'act_limit'
+    if model['experience_levels'][dancers[dancer].id] < constraints['min_experience'][j]:
+        return 'min_experience'
+    return None
+
+# Run profile being collected by profiled(), or None when instrumentation is off
+_profile = None
+
+@contextlib.contextmanager
+def profiled():
+    """Collect a run profile of the assignment pipeline inside this block
+    
+    Yields the profile dict, which is JSON-serializable.
+    """
+    global _profile, can_add_dancer
+    plain_can_add_dancer = can_add_dancer
+    counts = {'calls': 0, 'rejections': {reason: 0 for reason in REJECTION_REASONS}}
+    
+    def counted_can_add_dancer(dancer, dance, dancers, dances, model):
+        counts['calls'] += 1
+        if plain_can_add_dancer(dancer, dance, dancers, dances, model):
+            return True
+        counts['rejections'][rejection_reason(dancer, dance, dancers, dances, model)] += 1
+        return False
+    
+    profile = {'can_add_dancer': counts, 'stages': {}, 'passes': [], 'optimize_assignments': []}
+    _profile, can_add_dancer = profile, counted_can_add_dancer
+    try:
+        yield profile
+    finally:
+        _profile, can_add_dancer = None, plain_can_add_dancer
+
+@contextlib.contextmanager
+def profile_stage(name):
+    """Record the wall time of a pipeline stage when profiling"""
+    start = time.perf_counter()
+    yield
+    if _profile is not None:
+        _profile['stages'][name] = time.perf_counter() - start
+
+def identify_excluded_dancers(model):
+    """Identify dancers that are rated 1 by more than EXCLUSION_THRESHOLD of choreographers
+    
+    A model may override the threshold ('exclusion_threshold') and name
+    dancers to exclude outright ('excluded_dancers'), as what-if scenarios do.
+    """
+    total_dances = len(model['dance_names'])
+    share = model.get('exclusion_threshold', EXCLUSION_THRESHOLD)
+    threshold = share * total_dances
     
     # Count how many dances gave each dancer a rating of 1
-    rating_1_counts = defaultdict(int)
-    for dance in dances:
-        for dancer in dances[dance]['ratings'][1]:
-            rating_1_counts[dancer] += 1
+    rating_1_counts = (model['ratings'] == 1).sum(axis=1)
     
     # Find dancers above threshold
-    excluded_dancers = [
-        dancer for dancer, count in rating_1_counts.items() 
-        if count >= threshold
-    ]
+    excluded_ids = np.flatnonzero((rating_1_counts > 0) & (rating_1_counts >= threshold))
+    excluded_dancers = [model['dancer_names'][i] for i in excluded_ids]
     
     if excluded_dancers:
-        print("\nWARNING: The following dancers were rated poorly by >60% of choreographers")
+        print(f"\nWARNING: The following dancers were rated poorly by >{share:.0%} of choreographers")
         print("and will be excluded from assignments:")
-        for dancer in excluded_dancers:
-            print(f"- {dancer} (rated 1 by {rating_1_counts[dancer]} choreographers)")
+        for i, dancer in zip(excluded_ids, excluded_dancers):
+            print(f"- {dancer} (rated 1 by {rating_1_counts[i]} choreographers)")
         print()
     
-    return set(excluded_dancers)
+    return set(excluded_dancers) | set(model.get('excluded_dancers', ()))
 
-def assign_dancers(dancers, dances):
-    """Main matching algorithm"""
+def assign_dancers(dancers, dances, model, rng=None):
+    """Main matching algorithm (rng shuffles the order dancers are visited in)"""
     # First identify dancers to exclude
-    excluded_dancers = identify_excluded_dancers(dances)
+    excluded_dancers = identify_excluded_dancers(model)
     
-    # First pass: Assign dancers to ONE of their most wanted dances
-    for dancer in dancers:
+    # Visit dancers in file order, or in a random order for multi-start runs
+    visit_order = list(dancers)
+    if rng is not None:
+        rng.shuffle(visit_order)
+    
+    run_assignment_passes(dancers, dances, model, visit_order, excluded_dancers)
+
+    # Print warning for any still-unassigned dancers
+    warn_unassigned(dancers, excluded_dancers)
+
+    # Optional: Optimization pass to improve assignments
+    optimize_assignments(dancers, dances, model, excluded_dancers)
+
+def run_assignment_passes(dancers, dances, model, visit_order, excluded_dancers):
+    """Run the greedy ASSIGNMENT_PASSES in order, timing each one when profiling"""
+    for assignment_pass in ASSIGNMENT_PASSES:
+        if _profile is None:
+            assignment_pass(dancers, dances, model, visit_order, excluded_dancers)
+            continue
+        placed = sum(len(dances[dance].current_dancers) for dance in dances)
+        start = time.perf_counter()
+        assignment_pass(dancers, dances, model, visit_order, excluded_dancers)
+        _profile['passes'].append({
+            'name': assignment_pass.__name__,
+            'seconds': time.perf_counter() - start,
+            'assignments': sum(len(dances[dance].current_dancers) for dance in dances) - placed
+        })
+
+def assign_most_wanted(dancers, dances, model, visit_order, excluded_dancers):
+    """First pass: Assign dancers to ONE of their most wanted dances"""
+    for dancer in visit_order:
         if dancer in excluded_dancers:
             continue
-        for dance in dancers[dancer]['most']:
-            if dance in dances and can_add_dancer(dancer, dance, dancers, dances):
-                if get_dancer_rating(dancer, dance, dances) > 0:  # Only assign if rated
-                    dances[dance]['current_dancers'].append(dancer)
-                    dancers[dancer]['current_dances'].append(dance)
+        for dance in dancers[dancer].most:
+            if dance in dances and can_add_dancer(dancer, dance, dancers, dances, model):
+                if get_dancer_rating(dancer, dance, model) > 0:  # Only assign if rated
+                    add_assignment(dancer, dance, dancers, dances)
                     break  # Only assign ONE dance initially
+
+def assign_coverage(dancers, dances, model, visit_order, excluded_dancers):
+    """Second pass: Ensure everyone has at least one dance, most constrained dancers first"""
+    values = placement_values(model)
+    requires = np.array([bool(mask) for mask in model['constraints']['requires']], dtype=bool)
+    open_dances = np.array([len(dances[dance].current_dancers) < dances[dance].max_dancers[1] for dance in dances],
+                           dtype=bool) & ~requires
+    unplaced = [dancer for dancer in visit_order
+                if dancer not in excluded_dancers and len(dancers[dancer].current_dances) == 0]
+    if not unplaced:
+        return
     
-    # Second pass: Ensure everyone has at least one dance (using "okay" preferences)
-    for dancer in dancers:
-        if dancer in excluded_dancers:
+    # Number of open dances each unplaced dancer could join, and the dancers each dance rated
+    waiting = np.zeros(len(model['dancer_names']), dtype=bool)
+    waiting[[dancers[dancer].id for dancer in unplaced]] = True
+    rated_dancers, rated_dances = np.nonzero(values)
+    options = np.bincount(rated_dancers[open_dances[rated_dances]], minlength=len(waiting)) * waiting
+    by_dance = np.argsort(rated_dances, kind='stable')
+    rated_dancers = rated_dancers[by_dance]
+    bounds = np.searchsorted(rated_dances[by_dance], np.arange(len(model['dance_names']) + 1))
+    position_of = {dancers[dancer].id: position for position, dancer in enumerate(unplaced)}
+    heap = [(int(options[dancers[dancer].id]), position, dancer) for position, dancer in enumerate(unplaced)]
+    heapq.heapify(heap)
+    
+    while heap:
+        count, position, dancer = heapq.heappop(heap)
+        i = dancers[dancer].id
+        if not waiting[i] or count > options[i]:
             continue
-        if len(dancers[dancer]['current_dances']) == 0:
-            # Try their "okay" dances first
-            for dance in dancers[dancer]['okay']:
-                if dance in dances and can_add_dancer(dancer, dance, dancers, dances):
-                    if get_dancer_rating(dancer, dance, dances) > 0:
-                        dances[dance]['current_dancers'].append(dancer)
-                        dancers[dancer]['current_dances'].append(dance)
-                        break
-            
-            # If still not assigned, try any available dance
-            if len(dancers[dancer]['current_dances']) == 0:
-                for dance in dances:
-                    if (dance not in dancers[dancer]['no'] and 
-                        can_add_dancer(dancer, dance, dancers, dances) and 
-                        get_dancer_rating(dancer, dance, dances) > 0):
-                        dances[dance]['current_dancers'].append(dancer)
-                        dancers[dancer]['current_dances'].append(dance)
-                        break
+        waiting[i] = False
+        if count == 0:
+            continue
+        
+        # "okay" dances first, then any other open dance that rated them, best first
+        row = values[i]
+        rated = np.flatnonzero((row > 0) & open_dances)
+        rated = [model['dance_names'][j] for j in rated[np.argsort(-row[rated], kind='stable')]]
+        for dance in [dance for dance in dancers[dancer].okay if dance in dances] + rated:
+            if can_add_dancer(dancer, dance, dancers, dances, model) and row[dances[dance].id] > 0:
+                add_assignment(dancer, dance, dancers, dances)
+                j = dances[dance].id
+                if len(dances[dance].current_dancers) >= dances[dance].max_dancers[1] and open_dances[j]:
+                    open_dances[j] = False
+                    rated = rated_dancers[bounds[j]:bounds[j + 1]]
+                    rated = rated[waiting[rated]]
+                    options[rated] -= 1
+                    for k in rated.tolist():
+                        heapq.heappush(heap, (int(options[k]), position_of[k], model['dancer_names'][k]))
+                break
 
-    # Third pass: Now assign additional dances up to limits
-    for dancer in dancers:
+def assign_additional(dancers, dances, model, visit_order, excluded_dancers):
+    """Third pass: Now assign additional dances up to limits"""
+    for dancer in visit_order:
         if dancer in excluded_dancers:
             continue
         # First try their "most" preferences
-        for dance in dancers[dancer]['most']:
-            if dance in dances and can_add_dancer(dancer, dance, dancers, dances):
-                if get_dancer_rating(dancer, dance, dances) > 0:
-                    dances[dance]['current_dancers'].append(dancer)
-                    dancers[dancer]['current_dances'].append(dance)
+        for dance in dancers[dancer].most:
+            if dance in dances and can_add_dancer(dancer, dance, dancers, dances, model):
+                if get_dancer_rating(dancer, dance, model) > 0:
+                    add_assignment(dancer, dance, dancers, dances)
 
         # Then try their "okay" preferences
-        for dance in dancers[dancer]['okay']:
-            if dance in dances and can_add_dancer(dancer, dance, dancers, dances):
-                if get_dancer_rating(dancer, dance, dances) > 0:
-                    dances[dance]['current_dancers'].append(dancer)
-                    dancers[dancer]['current_dances'].append(dance)
+        for dance in dancers[dancer].okay:
+            if dance in dances and can_add_dancer(dancer, dance, dancers, dances, model):
+                if get_dancer_rating(dancer, dance, model) > 0:
+                    add_assignment(dancer, dance, dancers, dances)
 
-    # Print warning for any still-unassigned dancers
-    unassigned = [d for d in dancers if d not in excluded_dancers and len(dancers[d]['current_dances']) == 0]
+# The greedy passes, in the order assign_dancers runs them
+ASSIGNMENT_PASSES = (assign_most_wanted, assign_coverage, assign_additional)
+
+def max_flow_cut(num_nodes, tails, heads, capacities, source, sink):
+    """Max flow over the given arcs
+    
+    Returns the flow value, the flow on every arc, and the nodes on each side
+    of a minimum cut: those the source can still reach in the residual graph
+    and those that can still reach the sink.
+    """
+    capacity = sparse.csr_array((np.asarray(capacities, dtype=np.int32), (tails, heads)), shape=(num_nodes, num_nodes))
+    result = csgraph.maximum_flow(capacity, source, sink)
+    # Arcs with capacity left (including reversed arcs that carry flow) form the residual graph
+    residual = sparse.csr_array(capacity - result.flow)
+    residual.data[residual.data < 0] = 0
+    residual.eliminate_zeros()
+    source_side = csgraph.breadth_first_order(residual, source, directed=True, return_predecessors=False)
+    sink_side = csgraph.breadth_first_order(residual.T.tocsr(), sink, directed=True, return_predecessors=False)
+    return result.flow_value, sparse.csr_array(result.flow), source_side, sink_side
+
+def diagnose_feasibility(dancers, dances, model, excluded_dancers, max_listed=10):
+    """Use max-flow to show what any assignment could achieve before solving
+    
+    Prints a summary and returns a dict with the number of candidate
+    dancers, max_coverage, and the names found: no_options, tight_dancers,
+    tight_dances, short_alone and short_together.
+    """
+    num_dancers = len(model['dancer_names'])
+    num_dances = len(model['dance_names'])
+    allowed = allowed_placements(model)
+    excluded_ids = [dancers[dancer].id for dancer in excluded_dancers]
+    allowed[excluded_ids] = False
+    candidates = np.ones(num_dancers, dtype=bool)
+    candidates[excluded_ids] = False
+    candidate_ids = np.flatnonzero(candidates)
+    low, high = np.array([dances[dance].max_dancers for dance in model['dance_names']], dtype=np.int64).reshape(-1, 2).T
+    max_dances = np.array([dancers[dancer].dances[1] for dancer in model['dancer_names']], dtype=np.int64)
+    
+    # Nodes: source 0, dancers 1..n, dances n+1..n+m, sink n+m+1
+    source, sink = 0, num_dancers + num_dances + 1
+    dancer_nodes = candidate_ids + 1
+    dance_nodes = np.arange(num_dances) + num_dancers + 1
+    rows, cols = np.nonzero(allowed)
+    tails = np.concatenate([np.zeros(len(candidate_ids), dtype=np.int64), rows + 1, dance_nodes])
+    heads = np.concatenate([dancer_nodes, cols + num_dancers + 1, np.full(num_dances, sink)])
+    
+    # Coverage: source -> dancer (1) -> dance (uncapped) -> sink (NumDancers maximum)
+    uncapped = np.full(len(rows), len(candidate_ids) + 1)
+    coverage, _, source_side, _ = max_flow_cut(sink + 1, tails, heads,
+                                            np.concatenate([np.ones(len(candidate_ids)), uncapped, high]), source, sink)
+    tight = np.zeros(sink + 1, dtype=bool)
+    tight[source_side] = True
+    tight_ids = np.flatnonzero(tight[1:num_dancers + 1])
+    no_option_ids = tight_ids[~allowed[tight_ids].any(axis=1)]
+    tight_dances = np.flatnonzero(tight[num_dancers + 1:sink])
+    
+    # Minimums: source -> dancer (their maximum) -> dance (1) -> sink (NumDancers minimum)
+    _, flow, _, sink_side = max_flow_cut(sink + 1, tails, heads,
+                                         np.concatenate([max_dances[candidate_ids], np.ones(len(rows)), low]),
+                                         source, sink)
+    inflow = flow[dance_nodes, np.full(num_dances, sink)]
+    eligible = allowed.sum(axis=0)
+    short_alone = np.flatnonzero(eligible < low)
+    competing = np.zeros(sink + 1, dtype=bool)
+    competing[sink_side] = True
+    competing = competing[num_dancers + 1:sink] & (eligible >= low)
+    short_together = np.flatnonzero(competing) if (competing & (inflow < low)).any() else np.array([], dtype=np.int64)
+    
+    names = model['dancer_names']
+    dance_names = model['dance_names']
+    
+    def listed(ids, labels):
+        shown = ', '.join(labels[k] for k in ids[:max_listed])
+        return shown + (f" and {len(ids) - max_listed} more" if len(ids) > max_listed else "")
+    
+    print(f"\nFeasibility: at most {coverage} of {len(candidate_ids)} dancers can be given a dance")
+    if len(no_option_ids):
+        print(f"- {len(no_option_ids)} dancer(s) have no allowed dance at all: {listed(no_option_ids, names)}")
+    if len(tight_ids) > len(no_option_ids):
+        print(f"- {len(tight_ids) - len(no_option_ids)} dancer(s) compete for {len(tight_dances)} dance(s) "
+              f"with room for {high[tight_dances].sum()}: {listed(tight_dances, dance_names)}")
+    for j in short_alone:
+        print(f"- {dance_names[j]} needs at least {low[j]} dancers but only {eligible[j]} may join it")
+    if len(short_together):
+        print(f"- {len(short_together)} dance(s) compete for the same dancers and need at least "
+              f"{low[short_together].sum()} between them but can get only {inflow[short_together].sum()}: "
+              f"{listed(short_together, dance_names)}")
+    
+    return {
+        'dancers': len(candidate_ids),
+        'max_coverage': int(coverage),
+        'no_options': [names[i] for i in no_option_ids],
+        'tight_dancers': [names[i] for i in tight_ids],
+        'tight_dances': [dance_names[j] for j in tight_dances],
+        'short_alone': [dance_names[j] for j in short_alone],
+        'short_together': [dance_names[j] for j in short_together]
+    }
+
+def warn_unassigned(dancers, excluded_dancers):
+    """Print a warning listing dancers who ended up without any dance"""
+    unassigned = [d for d in dancers if d not in excluded_dancers and len(dancers[d].current_dances) == 0]
     if unassigned:
         print("\nWARNING: Could not assign the following dancers to any dances:")
         for dancer in unassigned:
             print(f"- {dancer}")
         print()
 
-    # Optional: Optimization pass to improve assignments
-    optimize_assignments(dancers, dances, excluded_dancers)
-
-def optimize_assignments(dancers, dances, excluded_dancers):
-    """Attempt to improve assignments by swapping dancers"""
-    improvements_made = True
-    while improvements_made:
-        improvements_made = False
-        for dance in dances:
-            if len(dances[dance]['current_dancers']) < dances[dance]['max_dancers'][1]:
-                # Look for highly rated dancers not in the dance
-                for rating in range(5, 2, -1):  # Only consider ratings 5-3
-                    for dancer in dances[dance]['ratings'][rating]:
-                        if dancer not in excluded_dancers and dancer not in dances[dance]['current_dancers']:
-                            if can_add_dancer(dancer, dance, dancers, dances):
-                                dances[dance]['current_dancers'].append(dancer)
-                                dancers[dancer]['current_dances'].append(dance)
-                                improvements_made = True
-
-def create_show_order(dances):
-    """Create optimal show order to minimize quick changes"""
-    graph = nx.Graph()
-    graph.add_nodes_from(dances.keys())
-    
-    # Add edges weighted by shared dancers
-    for dance1 in dances:
-        for dance2 in dances:
-            if dance1 < dance2:
-                shared = len(set(dances[dance1]['current_dancers']) & 
-                           set(dances[dance2]['current_dancers']))
-                if shared > 0:
-                    graph.add_edge(dance1, dance2, weight=shared)
-    
-    # Create show order using minimum spanning tree
-    mst = nx.minimum_spanning_tree(graph)
-    return list(nx.dfs_preorder_nodes(mst))
-
-def save_results(dancers, dances, show_order):
-    """Save results to CSV files"""
-    # Save dance assignments
-    assignments = []
+def add_assignment(dancer, dance, dancers, dances):
+    """Place a dancer in a dance"""
+    dances[dance].current_dancers[dancer] = None
+    dancers[dancer].current_dances[dance] = None
+    dancers[dancer].dance_bits |= 1 << dances[dance].id
+
+def remove_assignment(dancer, dance, dancers, dances):
+    """Take a dancer out of a dance"""
+    del dances[dance].current_dancers[dancer]
+    del dancers[dancer].current_dances[dance]
+    dancers[dancer].dance_bits &= ~(1 << dances[dance].id)
+
+def assignment_positions(dancer, dance, dancers, dances):
+    """Where a placement sits in its dance's and its dancer's insertion order"""
+    return list(dances[dance].current_dancers).index(dancer), list(dancers[dancer].current_dances).index(dance)
+
+def reinsert_assignment(dancer, dance, dancers, dances, positions):
+    """Undo remove_assignment, putting the placement back at the positions it held"""
+    dance_pos, dancer_pos = positions
+    dance_order = list(dances[dance].current_dancers)
+    dance_order.insert(dance_pos, dancer)
+    dances[dance].current_dancers = dict.fromkeys(dance_order)
+    dancer_order = list(dancers[dancer].current_dances)
+    dancer_order.insert(dancer_pos, dance)
+    dancers[dancer].current_dances = dict.fromkeys(dancer_order)
+    dancers[dancer].dance_bits |= 1 << dances[dance].id
+
+def optimize_assignments(dancers, dances, model, excluded_dancers, max_iterations=None, time_limit=None,
+                         start_dances=None):
+    """Improve assignments with add, move and swap moves driven by a worklist of changed dances
+    
+    Returns the number of improving moves made before the worklist empties or a budget runs out.
+    """
+    values = placement_values(model)
+    for dancer in excluded_dancers:
+        values[dancers[dancer].id] = 0
+    names = model['dancer_names']
+    
+    start = time.perf_counter()
+    deadline = None if time_limit is None else start + time_limit
+    worklist = deque(dances if start_dances is None else start_dances)
+    queued = set(worklist)
+    dances_visited = 0
+    iterations = 0
+    improvements = 0
+    out_of_budget = False
+    
+    def value(dancer, dance):
+        return values[dancers[dancer].id, dances[dance].id]
+    
+    def requeue(dance):
+        if dance not in queued:
+            worklist.append(dance)
+            queued.add(dance)
+    
+    while worklist and not out_of_budget:
+        dance = worklist.popleft()
+        queued.discard(dance)
+        dances_visited += 1
+        j = dances[dance].id
+        column = values[:, j]
+        candidates = np.flatnonzero(model['ratings'][:, j] >= 3)
+        candidates = candidates[np.argsort(-column[candidates], kind='stable')]
+        
+        for i in candidates[column[candidates] > 0]:
+            dancer = names[i]
+            if dance in dancers[dancer].current_dances:
+                continue
+            if ((max_iterations is not None and iterations >= max_iterations) or
+                    (deadline is not None and time.perf_counter() > deadline)):
+                out_of_budget = True
+                break
+            iterations += 1
+            
+            # Add: always an improvement when allowed
+            if can_add_dancer(dancer, dance, dancers, dances, model):
+                add_assignment(dancer, dance, dancers, dances)
+                improvements += 1
+                continue
+            
+            # Move: bring the dancer over from their least valuable dance
+            current = dancers[dancer].current_dances
+            if current:
+                worst = min(current, key=lambda d: value(dancer, d))
+                if column[i] > value(dancer, worst) and can_remove_dancer(dancer, worst, dancers, dances, model):
+                    positions = assignment_positions(dancer, worst, dancers, dances)
+                    remove_assignment(dancer, worst, dancers, dances)
+                    if can_add_dancer(dancer, dance, dancers, dances, model):
+                        add_assignment(dancer, dance, dancers, dances)
+                        improvements += 1
+                        requeue(worst)
+                        continue
+                    reinsert_assignment(dancer, worst, dancers, dances, positions)
+            
+            # Swap: trade places with a member of this dance who fits one of the candidate's dances
+            best = None
+            for other_dance in dancers[dancer].current_dances:
+                for member in dances[dance].current_dancers:
+                    if other_dance in dancers[member].current_dances:
+                        continue
+                    gain = (column[i] + value(member, other_dance)
+                            - value(member, dance) - value(dancer, other_dance))
+                    if value(member, other_dance) > 0 and gain > 0 and (best is None or gain > best[0]):
+                        best = (gain, member, other_dance)
+            if best is not None and not (can_remove_dancer(best[1], dance, dancers, dances, model) and
+                                         can_remove_dancer(dancer, best[2], dancers, dances, model)):
+                best = None
+            if best is not None:
+                _, member, other_dance = best
+                member_positions = assignment_positions(member, dance, dancers, dances)
+                dancer_positions = assignment_positions(dancer, other_dance, dancers, dances)
+                remove_assignment(member, dance, dancers, dances)
+                remove_assignment(dancer, other_dance, dancers, dances)
+                if (can_add_dancer(dancer, dance, dancers, dances, model) and
+                        can_add_dancer(member, other_dance, dancers, dances, model)):
+                    add_assignment(dancer, dance, dancers, dances)
+                    add_assignment(member, other_dance, dancers, dances)
+                    improvements += 1
+                    requeue(other_dance)
+                    continue
+                reinsert_assignment(dancer, other_dance, dancers, dances, dancer_positions)
+                reinsert_assignment(member, dance, dancers, dances, member_positions)
+    
+    if _profile is not None:
+        _profile['optimize_assignments'].append({
+            'seconds': time.perf_counter() - start,
+            'dances_visited': dances_visited,
+            'iterations': iterations,
+            'improvements': improvements,
+            'out_of_budget': out_of_budget
+        })
+    return improvements
+
+def allowed_placements(model):
+    """Dancer×dance mask of the placements any solver may make: rated, not on the "no" list, experienced enough"""
+    allowed = (model['ratings'] > 0) & ~model['no']
+    allowed &= model['experience_levels'][:, None] >= model['constraints']['min_experience'][None, :]
+    return allowed
+
+def placement_values(model):
+    """Value of placing each dancer in each dance (0 where the placement is not allowed)
+    
+    Values are small, so they are int16 and built in place: a dancer×dance
+    int16 array plus the boolean masks is all this allocates.
+    """
+    values = model['ratings'].astype(np.int16)
+    for key in ('most', 'okay'):
+        np.add(values, PREFERENCE_BONUS[key], out=values, where=model[key])
+    values *= allowed_placements(model)
+    return values
+
+def assignment_indices(dancers, dances):
+    """Dancer ids and dance ids of every current placement, as two parallel arrays"""
+    rows, cols = [], []
     for dance in dances:
-        for dancer in dances[dance]['current_dancers']:
-            assignments.append({
-                'Dance': dance,
-                'Dancer': dancer,
-                'Rating': get_dancer_rating(dancer, dance, dances)
-            })
-    
-    assignments_df = pd.DataFrame(assignments)
-    assignments_df.to_csv('dance_assignments.csv', index=False)
-    
-    # Save dancer assignments
-    dancer_assignments = []
+        members = dances[dance].current_dancers
+        rows += [dancers[dancer].id for dancer in members]
+        cols += [dances[dance].id] * len(members)
+    return np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)
+
+def assignment_objective(dancers, dances, model, values=None):
+    """Score an assignment so different solvers can be compared (higher is better)"""
+    if values is None:
+        values = placement_values(model)
+    rows, cols = assignment_indices(dancers, dances)
+    return int(values[rows, cols].sum(dtype=np.int64)) + COVERAGE_BONUS * len(np.unique(rows))
+
+def assignment_matrix(dancers, dances, model):
+    """Dancer×dance boolean matrix of the current assignment, as score_assignments takes it"""
+    matrix = np.zeros((len(model['dancer_names']), len(model['dance_names'])), dtype=bool)
+    matrix[assignment_indices(dancers, dances)] = True
+    return matrix
+
+def range_bounds(dancers, dances, model):
+    """(min, max) dances of each dancer and (min, max) dancers of each dance, as id-indexed arrays"""
+    dancer_range = np.zeros((len(model['dancer_names']), 2), dtype=np.int64)
     for dancer in dancers:
-        dancer_assignments.append({
-            'Dancer': dancer,
-            'Assigned_Dances': ','.join(dancers[dancer]['current_dances']),
-            'Number_of_Dances': len(dancers[dancer]['current_dances'])
-        })
+        dancer_range[dancers[dancer].id] = dancers[dancer].dances
+    dance_range = np.zeros((len(model['dance_names']), 2), dtype=np.int64)
+    for dance in dances:
+        dance_range[dances[dance].id] = dances[dance].max_dancers
+    return dancer_range, dance_range
+
+# Metrics returned by score_assignments, in column order
+SCORE_METRICS = ('objective', 'placements', 'mean_rating', 'most_share', 'okay_share', 'other_share',
+                 'unassigned', 'under_range', 'over_range', 'dances_under_min', 'dances_over_max')
+
+def score_assignments(assignments, dancers, dances, model, excluded_dancers=(), values=None):
+    """Score one dancer×dance boolean assignment matrix, or a stack of them, in one NumPy pass
     
-    dancer_df = pd.DataFrame(dancer_assignments)
-    dancer_df.to_csv('dancer_assignments.csv', index=False)
+    Returns a dict keyed by SCORE_METRICS: a number per metric for one
+    matrix, or an array with one entry per candidate for a (k, dancers,
+    dances) stack.
+    """
+    if values is None:
+        values = placement_values(model)
+    batch = assignments[None] if assignments.ndim == 2 else assignments
+    dancer_range, dance_range = range_bounds(dancers, dances, model)
+    active = np.ones(len(model['dancer_names']), dtype=bool)
+    active[[dancers[dancer].id for dancer in excluded_dancers]] = False
     
-    # Save show order
-    show_order_df = pd.DataFrame({'Order': range(1, len(show_order) + 1),
-                                 'Dance': show_order})
-    show_order_df.to_csv('show_order.csv', index=False)
+    per_dancer = batch.sum(axis=2)
+    per_dance = batch.sum(axis=1)
+    placed = per_dancer > 0
+    placements = per_dancer.sum(axis=1)
+    most = np.count_nonzero(batch & model['most'], axis=(1, 2))
+    okay = np.count_nonzero(batch & (model['okay'] & ~model['most']), axis=(1, 2))
+    share = np.maximum(placements, 1)
+    scores = {
+        'objective': (batch * values).sum(axis=(1, 2), dtype=np.int64) + COVERAGE_BONUS * placed.sum(axis=1),
+        'placements': placements,
+        'mean_rating': (batch * model['ratings']).sum(axis=(1, 2), dtype=np.int64) / share,
+        'most_share': most / share,
+        'okay_share': okay / share,
+        'other_share': (placements - most - okay) / share,
+        'unassigned': np.count_nonzero(~placed & active, axis=1),
+        'under_range': np.count_nonzero(placed & (per_dancer < dancer_range[:, 0]), axis=1),
+        'over_range': np.count_nonzero(per_dancer > dancer_range[:, 1], axis=1),
+        'dances_under_min': np.count_nonzero(per_dance < dance_range[:, 0], axis=1),
+        'dances_over_max': np.count_nonzero(per_dance > dance_range[:, 1], axis=1)
+    }
+    if assignments.ndim == 2:
+        return {metric: scores[metric][0].item() for metric in SCORE_METRICS}
+    return scores
 
-def main():
-    # Load data
-    dancers, dances = load_data()
+def assign_dancers_flow(dancers, dances, model):
+    """Optimal matching as a min-cost flow from dancers to dances
+    
+    Exclusive groups and act limits are built into the network; any other
+    constraint a flow cannot express is restored afterwards by
+    repair_assignments and the freed places refilled by local search.
+    """
+    excluded_dancers = identify_excluded_dancers(model)
+    values = placement_values(model)
+    for dancer in excluded_dancers:
+        values[dancers[dancer].id] = 0
+    
+    # Each dance is routed through (at most) the first constraint group it
+    # belongs to; the group node's capacity caps how many of its dances a
+    # dancer can take
+    groups = model['constraints']['groups']
+    group_of = {}
+    for g, (ids, _) in enumerate(groups):
+        for j in ids:
+            group_of.setdefault(j, g)
     
-    # Make assignments
-    assign_dancers(dancers, dances)
+    # source -> dancer -> dance -> sink, with the first unit into each dancer
+    # earning the coverage bonus; a direct source -> sink arc absorbs the
+    # capacity nobody can use
+    graph = nx.MultiDiGraph()
+    supply = 0
+    for dancer in dancers:
+        if dancer in excluded_dancers:
+            continue
+        i = dancers[dancer].id
+        max_dances = dancers[dancer].dances[1]
+        supply += max_dances
+        graph.add_edge('source', ('dancer', i), capacity=1, weight=-COVERAGE_BONUS)
+        graph.add_edge('source', ('dancer', i), capacity=max_dances - 1, weight=0)
+        for g, (_, capacity) in enumerate(groups):
+            graph.add_edge(('dancer', i), ('group', i, g), capacity=capacity, weight=0)
+    for dance in dances:
+        graph.add_edge(('dance', dances[dance].id), 'sink', capacity=dances[dance].max_dancers[1], weight=0)
+    graph.add_edge('source', 'sink', capacity=supply, weight=0)
+    graph.nodes['source']['demand'] = -supply
+    graph.nodes['sink']['demand'] = supply
     
-    # Generate show order
-    show_order = create_show_order(dances)
+    # One unit arc per allowed placement, costed by its value
+    rows, cols = np.nonzero(values)
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        tail = ('group', i, group_of[j]) if j in group_of else ('dancer', i)
+        graph.add_edge(tail, ('dance', j), capacity=1, weight=-int(values[i, j]))
     
-    # Save results
-    save_results(dancers, dances, show_order)
+    _, flow = nx.network_simplex(graph)
+    
+    for dancer in dancers:
+        if dancer in excluded_dancers:
+            continue
+        i = dancers[dancer].id
+        placed = []
+        for tail in [('dancer', i)] + [('group', i, g) for g in range(len(groups))]:
+            placed += [node[1] for node, arcs in flow[tail].items() if node[0] == 'dance' and arcs[0]]
+        for j in sorted(placed):
+            dance = model['dance_names'][j]
+            add_assignment(dancer, dance, dancers, dances)
+    
+    if repair_assignments(dancers, dances, model):
+        optimize_assignments(dancers, dances, model, excluded_dancers)
+    warn_unassigned(dancers, excluded_dancers)
+
+def repair_assignments(dancers, dances, model):
+    """Drop placements that break a constraint and return how many were dropped
+    
+    Each dancer's dances are cleared and offered back until no more fit, so
+    a dance whose requirements are met by a later one is still kept.
+    """
+    dropped = 0
+    for dancer in dancers:
+        pending = list(dancers[dancer].current_dances)
+        for dance in pending:
+            remove_assignment(dancer, dance, dancers, dances)
+        dropped += len(add_while_possible(dancer, pending, dancers, dances, model))
+    return dropped
+
+def add_while_possible(dancer, pending, dancers, dances, model):
+    """Offer a dancer their pending dances until no more fit, and return the ones that did not
+    
+    Passes repeat while any dance is added, so a dance whose requirements
+    come later in the list is still placed.
+    """
+    pending = list(pending)
+    progress = True
+    while pending and progress:
+        progress = False
+        for dance in list(pending):
+            if can_add_dancer(dancer, dance, dancers, dances, model):
+                add_assignment(dancer, dance, dancers, dances)
+                pending.remove(dance)
+                progress = True
+    return pending
+
+def dance_rank_table(model):
+    """How much each dance wants each dancer (higher is better, 0 where the placement is not allowed)
+    
+    Dances rank by choreographer rating first and then by the dancer's own
+    interest, so a "most" dancer beats an "okay" dancer with the same rating.
+    """
+    ranks = model['ratings'].astype(np.int16) * 3
+    ranks += 2 * model['most'] + model['okay']
+    ranks[placement_values(model) == 0] = 0
+    return ranks
+
+def assign_dancers_deferred(dancers, dances, model):
+    """Many-to-many deferred acceptance: dancers propose, dances keep the best-ranked proposers"""
+    excluded_dancers = identify_excluded_dancers(model)
+    ranks = dance_rank_table(model)
+    dance_ids = model['dance_ids']
+    
+    # Dancer-side preference lists (allowed placements only) and per-dance heaps of (rank, -id, dancer)
+    proposals = {}
+    for dancer in dancers:
+        if dancer in excluded_dancers:
+            continue
+        i = dancers[dancer].id
+        rated = np.flatnonzero(ranks[i])
+        rated = rated[np.argsort(-ranks[i, rated], kind='stable')]
+        wanted = dict.fromkeys(dancers[dancer].most + dancers[dancer].okay + [model['dance_names'][j] for j in rated])
+        proposals[dancer] = [dance for dance in wanted if dance in dance_ids and ranks[i, dance_ids[dance]] > 0]
+    heaps = {dance: [] for dance in dances}
+    next_proposal = dict.fromkeys(proposals, 0)
+    queue = deque(proposals)
+    queued = set(proposals)
+    
+    while queue:
+        dancer = queue.popleft()
+        queued.discard(dancer)
+        i = dancers[dancer].id
+        wanted = proposals[dancer]
+        while len(dancers[dancer].current_dances) < dancers[dancer].dances[1] and next_proposal[dancer] < len(wanted):
+            dance = wanted[next_proposal[dancer]]
+            next_proposal[dancer] += 1
+            heap = heaps[dance]
+            key = (int(ranks[i, dances[dance].id]), -i, dancer)
+            
+            if len(heap) < dances[dance].max_dancers[1]:
+                if can_add_dancer(dancer, dance, dancers, dances, model):
+                    add_assignment(dancer, dance, dancers, dances)
+                    heapq.heappush(heap, key)
+                continue
+            if not heap or key[:2] < heap[0][:2]:
+                continue
+            
+            # Evict the dance's worst member, unless one of the dancer's own rules rules the dance out
+            worst = heapq.heappop(heap)
+            remove_assignment(worst[2], dance, dancers, dances)
+            if can_add_dancer(dancer, dance, dancers, dances, model):
+                add_assignment(dancer, dance, dancers, dances)
+                heapq.heappush(heap, key)
+                if worst[2] not in queued:
+                    queue.append(worst[2])
+                    queued.add(worst[2])
+            else:
+                add_assignment(worst[2], dance, dancers, dances)
+                heapq.heappush(heap, worst)
+    
+    # An eviction can take away a dance another of the dancer's dances requires
+    repair_assignments(dancers, dances, model)
+    warn_unassigned(dancers, excluded_dancers)
+
+def snapshot_assignment(dancers, dances):
+    """Copy of the current assignment (each dance's and dancer's members in order)"""
+    return ({dance: list(dances[dance].current_dancers) for dance in dances},
+            {dancer: list(dancers[dancer].current_dances) for dancer in dancers})
+
+def restore_assignment(dancers, dances, snapshot):
+    """Replace the current assignment with one taken by snapshot_assignment"""
+    dance_members, dancer_dances = snapshot
+    for dance in dances:
+        dances[dance].current_dancers = dict.fromkeys(dance_members[dance])
+    for dancer in dancers:
+        dancers[dancer].current_dances = dict.fromkeys(dancer_dances[dancer])
+        dancers[dancer].dance_bits = sum(1 << dances[dance].id for dance in dancer_dances[dancer])
+
+# Arrays copied into shared memory for multi-start workers
+SHARED_ARRAYS = ('ratings', 'most', 'okay', 'no')
+
+# State of a multi-start or scenario worker process, set up once by _init_pool_worker
+_pool_worker = {}
+
+def share_model(model):
+    """Copy the model's arrays into shared memory blocks
+    
+    Returns the blocks (the caller must close and unlink them) and a picklable
+    spec of the model with each array replaced by (block name, shape, dtype).
+    """
+    blocks = []
+    spec = {key: value for key, value in model.items() if key not in SHARED_ARRAYS}
+    for key in SHARED_ARRAYS:
+        array = model[key]
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+        spec[key] = (block.name, array.shape, array.dtype.str)
+    return blocks, spec
+
+def attach_model(spec):
+    """Rebuild a model from share_model's spec as views of the shared blocks"""
+    blocks = []
+    model = {key: value for key, value in spec.items() if key not in SHARED_ARRAYS}
+    for key in SHARED_ARRAYS:
+        name, shape, dtype = spec[key]
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        model[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, model
+
+def _init_pool_worker(dancers, dances, spec):
+    """Attach a worker to the shared model once, instead of pickling it per start"""
+    blocks, model = attach_model(spec)
+    _pool_worker.update(dancers=dancers, dances=dances, model=model, blocks=blocks)
+
+def _run_start(seed):
+    """One greedy start (with local search) on a fresh copy of the worker's state
+    
+    A seed of None keeps the file order; any other seed shuffles the visit order.
+    """
+    dancers = copy.deepcopy(_pool_worker['dancers'])
+    dances = copy.deepcopy(_pool_worker['dances'])
+    model = _pool_worker['model']
+    with contextlib.redirect_stdout(io.StringIO()):
+        assign_dancers(dancers, dances, model, rng=None if seed is None else random.Random(seed))
+    return seed, assignment_objective(dancers, dances, model), snapshot_assignment(dancers, dances)
+
+def assign_dancers_multistart(dancers, dances, model, starts=MULTISTART_STARTS, workers=None, seed=0):
+    """Run seeded, randomized greedy starts on a process pool and keep the best one
+    
+    The first start keeps the file order (so the result is never worse than
+    the plain greedy solver) and the rest shuffle it with seeds seed,
+    seed+1, ...; starts are ranked by assignment_objective. The rating and
+    preference arrays are placed in shared memory so every worker reads the
+    same copy. Returns the objective of every start keyed by seed (None for
+    the file order).
+    """
+    excluded_dancers = identify_excluded_dancers(model)
+    workers = max(1, min(starts, workers or os.cpu_count() or 1))
+    blocks, spec = share_model(model)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker,
+                                 initargs=(dancers, dances, spec)) as pool:
+            results = list(pool.map(_run_start, [None] + list(range(seed, seed + starts - 1))))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    
+    best_seed, best_objective, snapshot = max(results, key=lambda result: result[1])
+    restore_assignment(dancers, dances, snapshot)
+    
+    scores = np.array([result[1] for result in results])
+    print(f"\nMulti-start: {starts} starts on {workers} worker(s), best objective {best_objective} (seed {best_seed})")
+    print(f"Objective spread: min {scores.min()}, mean {scores.mean():.1f}, max {scores.max()}, std {scores.std():.1f}")
+    warn_unassigned(dancers, excluded_dancers)
+    return {result[0]: result[1] for result in results}
+
+def objective_upper_bound(dancers, dances, model, excluded_dancers, values=None):
+    """An upper bound on assignment_objective, used to estimate how far a solution is from optimal"""
+    if values is None:
+        values = placement_values(model)
+    values = values.copy()
+    for dancer in excluded_dancers:
+        values[dancers[dancer].id] = 0
+    max_dances = np.zeros(len(model['dancer_names']), dtype=np.int64)
+    for dancer in dancers:
+        max_dances[dancers[dancer].id] = dancers[dancer].dances[1]
+    capacity = np.zeros(len(model['dance_names']), dtype=np.int64)
+    for dance in dances:
+        capacity[dances[dance].id] = dances[dance].max_dancers[1]
+    
+    # Values are small integers, so the best k values of a row sum to the
+    # number of them at or above each level: sum over levels of min(count, k)
+    dancer_total = dance_total = 0
+    for level in range(1, int(values.max(initial=0)) + 1):
+        at_level = values >= level
+        dancer_total += int(np.minimum(at_level.sum(axis=1), max_dances).sum())
+        dance_total += int(np.minimum(at_level.sum(axis=0), capacity).sum())
+    coverable = int(np.count_nonzero((values > 0).any(axis=1) & (max_dances > 0)))
+    return min(dancer_total, dance_total) + COVERAGE_BONUS * min(coverable, int(capacity.sum()))
+
+def solve_anytime(dancers, dances, model, time_limit=ANYTIME_TIME_LIMIT, seed=0, excluded_dancers=None):
+    """Generator of improving assignments within a wall-clock budget
+    
+    Yields a report dict (stage, objective, seconds, bound, gap) for each
+    improvement; dancers and dances hold the best assignment whenever the
+    generator finishes or is closed.
+    """
+    start = time.perf_counter()
+    deadline = start + time_limit
+    if excluded_dancers is None:
+        excluded_dancers = identify_excluded_dancers(model)
+    values = placement_values(model)
+    bound = objective_upper_bound(dancers, dances, model, excluded_dancers, values)
+    best = None
+    
+    def improved(stage, trial_dancers, trial_dances):
+        nonlocal best
+        objective = assignment_objective(trial_dancers, trial_dances, model, values)
+        if best is not None and objective <= best[0]:
+            return None
+        best = (objective, snapshot_assignment(trial_dancers, trial_dances))
+        if trial_dancers is not dancers:
+            restore_assignment(dancers, dances, best[1])
+        return {
+            'stage': stage,
+            'objective': objective,
+            'seconds': time.perf_counter() - start,
+            'bound': bound,
+            'gap': (bound - objective) / bound if bound else 0.0
+        }
+    
+    try:
+        run_assignment_passes(dancers, dances, model, list(dancers), excluded_dancers)
+        yield improved('greedy', dancers, dances)
+        
+        # Local search on the greedy assignment until it converges or time runs out
+        slice_limit = ANYTIME_SLICE
+        while time.perf_counter() < deadline:
+            slice_start = time.perf_counter()
+            optimize_assignments(dancers, dances, model, excluded_dancers,
+                                 time_limit=min(slice_limit, deadline - slice_start))
+            converged = time.perf_counter() - slice_start < slice_limit
+            report = improved('local search', dancers, dances)
+            if report is not None:
+                yield report
+            if converged:
+                break
+            slice_limit *= 2
+        
+        # Randomized restarts with whatever time is left
+        restart = 0
+        while time.perf_counter() < deadline:
+            restart += 1
+            trial_dancers, trial_dances = blank_state(dancers, dances)
+            visit_order = list(dancers)
+            random.Random(seed + restart - 1).shuffle(visit_order)
+            run_assignment_passes(trial_dancers, trial_dances, model, visit_order, excluded_dancers)
+            optimize_assignments(trial_dancers, trial_dances, model, excluded_dancers,
+                                 time_limit=max(0.0, deadline - time.perf_counter()))
+            report = improved(f'restart {restart}', trial_dancers, trial_dances)
+            if report is not None:
+                yield report
+    except KeyboardInterrupt:
+        if best is None:
+            raise
+        print("  interrupted, keeping the best assignment so far")
+    finally:
+        # An interrupted move can leave the live state half-updated
+        if best is not None:
+            restore_assignment(dancers, dances, best[1])
+
+def assign_dancers_anytime(dancers, dances, model, time_limit=ANYTIME_TIME_LIMIT):
+    """Run solve_anytime, printing each improvement, and keep the best assignment
+    
+    Ctrl-C stops the search early; the best assignment found so far is kept.
+    Returns the list of improvement reports.
+    """
+    excluded_dancers = identify_excluded_dancers(model)
+    reports = []
+    print(f"\nAnytime search for up to {time_limit:g}s (Ctrl-C keeps the best so far):")
+    search = solve_anytime(dancers, dances, model, time_limit=time_limit, excluded_dancers=excluded_dancers)
+    try:
+        for report in search:
+            reports.append(report)
+            print(f"  {report['seconds']:7.2f}s  objective {report['objective']}  "
+                  f"gap <= {report['gap']:.1%}  ({report['stage']})")
+    except KeyboardInterrupt:
+        print("  interrupted, keeping the best assignment so far")
+    finally:
+        search.close()
+    warn_unassigned(dancers, excluded_dancers)
+    return reports
+
+# Selectable assignment engines (see --solver)
+SOLVERS = {
+    'greedy': assign_dancers,
+    'flow': assign_dancers_flow,
+    'multistart': assign_dancers_multistart,
+    'deferred': assign_dancers_deferred,
+    'anytime': assign_dancers_anytime
+}
+
+# Overrides a what-if scenario may set (see evaluate_scenarios)
+SCENARIO_KEYS = ('name', 'solver', 'capacity', 'exclude', 'exclusion_threshold')
+
+def blank_state(dancers, dances, capacity=None):
+    """New Dancer and Dance objects with no assignments
+    
+    The parsed preference lists are shared with the originals rather than
+    copied (nothing modifies them), so this is much cheaper than a deepcopy.
+    capacity maps dance names to new (min, max) dancer counts.
+    """
+    capacity = capacity or {}
+    new_dancers = {dancer: Dancer(d.id, d.experience, d.dances, d.most, d.okay, d.no) for dancer, d in dancers.items()}
+    new_dances = {dance: Dance(d.id, capacity.get(dance, d.max_dancers)) for dance, d in dances.items()}
+    return new_dancers, new_dances
+
+def check_worker_solver(solver, owner):
+    """Raise ValueError unless solver can run inside a pool worker (any solver but multistart)"""
+    if solver not in SOLVERS or solver == 'multistart':
+        raise ValueError(f"{owner} uses solver '{solver}'; "
+                         f"expected one of {', '.join(name for name in SOLVERS if name != 'multistart')}")
+
+def check_scenario(scenario, dancers, dances):
+    """Validate a scenario's overrides, raising ValueError for ones that cannot be applied"""
+    unknown = set(scenario) - set(SCENARIO_KEYS)
+    if unknown:
+        raise ValueError(f"Scenario '{scenario.get('name')}' has unknown override(s) {sorted(unknown)}; "
+                         f"expected {', '.join(SCENARIO_KEYS)}")
+    check_worker_solver(scenario.get('solver', 'greedy'), f"Scenario '{scenario.get('name')}'")
+    if not isinstance(scenario.get('exclude', []), list):
+        raise ValueError(f"Scenario '{scenario.get('name')}' must give 'exclude' as a list of dancer names")
+    if not isinstance(scenario.get('capacity', {}), dict):
+        raise ValueError(f"Scenario '{scenario.get('name')}' must give 'capacity' as an object of dance: range")
+    threshold = scenario.get('exclusion_threshold', 0)
+    if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or not 0 <= threshold <= 1:
+        raise ValueError(f"Scenario '{scenario.get('name')}' must give 'exclusion_threshold' as a number "
+                         f"from 0 to 1, not {threshold!r}")
+    for dance, value in scenario.get('capacity', {}).items():
+        try:
+            read_num_dancers(str(value))
+        except ValueError:
+            raise ValueError(f"Scenario '{scenario.get('name')}' gives {dance} the capacity {value!r}; "
+                             f"expected a NumDancers value such as 8 or \"6-8\"") from None
+    missing = ([dance for dance in scenario.get('capacity', {}) if dance not in dances] +
+               [dancer for dancer in scenario.get('exclude', []) if dancer not in dancers])
+    if missing:
+        raise ValueError(f"Scenario '{scenario.get('name')}' names unknown dances or dancers {missing}")
+
+def evaluate_scenario(dancers, dances, model, scenario, min_gap=1):
+    """Solve one what-if scenario on a blank copy of the state and summarize the result"""
+    capacity = {dance: parse_num_dancers(str(value)) for dance, value in scenario.get('capacity', {}).items()}
+    scenario_dancers, scenario_dances = blank_state(dancers, dances, capacity)
+    
+    # The model is shared; only the keys a scenario overrides are replaced in a shallow copy
+    scenario_model = dict(model)
+    if 'exclusion_threshold' in scenario:
+        scenario_model['exclusion_threshold'] = float(scenario['exclusion_threshold'])
+    if 'exclude' in scenario:
+        scenario_model['excluded_dancers'] = set(scenario['exclude'])
+    
+    solver = scenario.get('solver', 'greedy')
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        SOLVERS[solver](scenario_dancers, scenario_dances, scenario_model)
+        excluded_dancers = identify_excluded_dancers(scenario_model)
+        show_order = create_show_order(scenario_dances, scenario_model, min_gap=min_gap)
+    scores = score_assignments(assignment_matrix(scenario_dancers, scenario_dances, scenario_model),
+                               scenario_dancers, scenario_dances, scenario_model, excluded_dancers)
+    return {
+        'Scenario': scenario.get('name', ''),
+        'Solver': solver,
+        'Objective': scores['objective'],
+        'Mean_Rating': round(scores['mean_rating'], 3),
+        'Most_Share': round(scores['most_share'], 3),
+        'Unassigned': scores['unassigned'],
+        'Under_Range': scores['under_range'],
+        'Dances_Under_Min': scores['dances_under_min'],
+        'Excluded': len(excluded_dancers),
+        'Quick_Changes': sum(quick_changes(show_order, scenario_dances)),
+        'Seconds': round(time.perf_counter() - start, 3)
+    }
+
+def _run_scenario(args):
+    """evaluate_scenario on the worker's shared state"""
+    scenario, min_gap = args
+    return evaluate_scenario(_pool_worker['dancers'], _pool_worker['dances'], _pool_worker['model'],
+                             scenario, min_gap=min_gap)
+
+def evaluate_scenarios(dancers, dances, model, scenarios, workers=None, min_gap=1):
+    """Solve a list of what-if scenarios against one loaded model and compare them
+    
+    Returns a DataFrame with one row per scenario, the unchanged baseline first.
+    """
+    scenarios = [{'name': 'baseline'}] + list(scenarios)
+    for scenario in scenarios:
+        check_scenario(scenario, dancers, dances)
+    workers = max(1, min(len(scenarios), workers or os.cpu_count() or 1))
+    
+    if workers == 1:
+        rows = [evaluate_scenario(dancers, dances, model, scenario, min_gap=min_gap) for scenario in scenarios]
+    else:
+        blank_dancers, blank_dances = blank_state(dancers, dances)
+        blocks, spec = share_model(model)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker,
+                                     initargs=(blank_dancers, blank_dances, spec)) as pool:
+                rows = list(pool.map(_run_scenario, [(scenario, min_gap) for scenario in scenarios]))
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+    
+    comparison = pd.DataFrame(rows)
+    comparison.insert(3, 'Objective_Change', comparison['Objective'] - comparison['Objective'].iloc[0])
+    return comparison
+
+def load_scenarios(path):
+    """Read a JSON list of scenario overrides (see evaluate_scenarios)"""
+    with open(path, encoding='utf-8') as f:
+        scenarios = json.load(f)
+    if not isinstance(scenarios, list) or not all(isinstance(scenario, dict) for scenario in scenarios):
+        raise ValueError(f"{path} must hold a JSON list of scenario objects")
+    return scenarios
+
+# Settings a batch manifest entry may give (see solve_batch)
+SHOW_KEYS = ('name', 'input', 'output', 'solver', 'min_gap')
+SHOW_LOG = "run_log.txt"
+
+def load_manifest(path):
+    """Read a batch manifest: a JSON list of input directories or show objects (see solve_batch)
+    
+    Relative directories are resolved against the manifest's own folder.
+    """
+    with open(path, encoding='utf-8') as f:
+        shows = json.load(f)
+    if not isinstance(shows, list) or not all(isinstance(show, (str, dict)) for show in shows):
+        raise ValueError(f"{path} must hold a JSON list of input directories or show objects")
+    base = os.path.dirname(os.path.abspath(path))
+    shows = [{'input': show} if isinstance(show, str) else dict(show) for show in shows]
+    for show in shows:
+        for key in ('input', 'output'):
+            if isinstance(show.get(key), str):
+                show[key] = os.path.join(base, show[key])
+    return shows
+
+def check_show(show):
+    """Validate a batch manifest entry, raising ValueError for one that cannot be solved"""
+    unknown = set(show) - set(SHOW_KEYS)
+    if unknown:
+        raise ValueError(f"Show {show.get('name', show.get('input'))!r} has unknown setting(s) {sorted(unknown)}; "
+                         f"expected {', '.join(SHOW_KEYS)}")
+    if not isinstance(show.get('input'), str):
+        raise ValueError(f"Show {show.get('name')!r} has no input directory")
+    missing = [path for path in (DANCER_CSV, CHOREO_CSV) if not os.path.isfile(os.path.join(show['input'], path))]
+    if missing:
+        raise ValueError(f"Show input directory {show['input']} is missing {', '.join(missing)}")
+    check_worker_solver(show.get('solver', 'greedy'), f"Show {show.get('name', show['input'])!r}")
+
+def solve_show(show, cache=True, parquet=False, solver_options=None):
+    """Solve one show of a batch and save its results to its output directory
+    
+    Everything the run prints goes to SHOW_LOG in the output directory.
+    Returns the show's summary row: its size, objective, unassigned dancers
+    and the seconds each stage took.
+    """
+    solver = show.get('solver', 'greedy')
+    output = show.get('output', show['input'])
+    cache_dir = os.path.join(show['input'], CACHE_DIR) if cache else None
+    os.makedirs(output, exist_ok=True)
+    seconds = {}
+    
+    def stage(name, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds[name] = round(time.perf_counter() - start, 3)
+        return result
+    
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        dancers, dances, model = stage('Load_Seconds', load_data, cache_dir, directory=show['input'])
+        excluded_dancers = identify_excluded_dancers(model)
+        diagnose_feasibility(dancers, dances, model, excluded_dancers)
+        stage('Solve_Seconds', SOLVERS[solver], dancers, dances, model, **(solver_options or {}).get(solver, {}))
+        show_order = stage('Order_Seconds', create_show_order, dances, model, min_gap=show.get('min_gap', 1))
+        stage('Save_Seconds', save_results, dancers, dances, show_order, model, parquet=parquet, directory=output)
+        if cache_dir is not None:
+            record_last_run(cache_dir, model['input_digests'])
+    with open(os.path.join(output, SHOW_LOG), 'w', encoding='utf-8') as f:
+        f.write(log.getvalue())
+    
+    scores = score_assignments(assignment_matrix(dancers, dances, model), dancers, dances, model, excluded_dancers)
+    return {
+        'Show': show.get('name', os.path.basename(os.path.normpath(show['input']))),
+        'Solver': solver,
+        'Dancers': len(dancers),
+        'Dances': len(dances),
+        'Objective': scores['objective'],
+        'Unassigned': scores['unassigned'],
+        **seconds,
+        'Total_Seconds': round(sum(seconds.values()), 3),
+        'Output': output
+    }
+
+def _run_show(args):
+    """solve_show for a batch pool worker"""
+    return solve_show(*args)
+
+def solve_batch(shows, workers=None, cache=True, parquet=False, solver_options=None):
+    """Solve several shows, each with its own input CSVs, on a process pool
+    
+    Returns a DataFrame with one summary row per show (see solve_show), in manifest order.
+    """
+    for show in shows:
+        check_show(show)
+    outputs = [os.path.abspath(show.get('output', show['input'])) for show in shows]
+    repeated = sorted({output for output in outputs if outputs.count(output) > 1})
+    if repeated:
+        raise ValueError(f"Several shows would write their results to {', '.join(repeated)}")
+    
+    tasks = [(show, cache, parquet, solver_options) for show in shows]
+    workers = max(1, min(len(shows), workers or os.cpu_count() or 1))
+    if workers == 1:
+        rows = [_run_show(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(_run_show, tasks))
+    return pd.DataFrame(rows)
+
+def read_previous_assignments(path='dance_assignments.csv'):
+    """(dance, dancer) pairs of a saved dance_assignments.csv in file order, or None if there is none"""
+    if not os.path.exists(path):
+        return None
+    try:
+        previous = pd.read_csv(path, dtype=str, keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        return []
+    if not {'Dance', 'Dancer'} <= set(previous.columns):
+        return []
+    return list(zip(previous['Dance'].tolist(), previous['Dancer'].tolist()))
+
+def read_previous_dance_order(path='dancer_assignments.csv'):
+    """{dancer: [dances]} of a saved dancer_assignments.csv ({} if there is none)"""
+    try:
+        previous = pd.read_csv(path, dtype=str, keep_default_na=False)
+    except (OSError, pd.errors.EmptyDataError):
+        return {}
+    if not {'Dancer', 'Assigned_Dances'} <= set(previous.columns):
+        return {}
+    return {dancer: assigned.split(',') for dancer, assigned in zip(previous['Dancer'].tolist(), previous['Assigned_Dances'].tolist())}
+
+def dancer_signatures(table):
+    """64-bit hash of each row of a parsed dancer CSV, to spot edited rows without comparing them field by field"""
+    signatures = pd.util.hash_pandas_object(pd.DataFrame({
+        'experience': table['experience_levels'],
+        'min_dances': table['dance_ranges'][:, 0],
+        'max_dances': table['dance_ranges'][:, 1]
+    }), index=False).to_numpy()
+    for k, key in enumerate(('most', 'okay', 'no')):
+        # Preference order matters, so each item is hashed with its list and position
+        rows = table[f'{key}_rows']
+        entries = pd.DataFrame({'list': k, 'position': np.arange(len(rows)) - np.searchsorted(rows, rows),
+                                'item': table[f'{key}_items']})
+        np.add.at(signatures, rows, pd.util.hash_pandas_object(entries, index=False).to_numpy())
+    return signatures
+
+def dance_signatures(table):
+    """64-bit hash of each row of a parsed choreographer CSV, to spot edited rows without comparing them field by field"""
+    signatures = pd.util.hash_pandas_object(pd.DataFrame({
+        'min_dancers': table['max_dancers'][:, 0],
+        'max_dancers': table['max_dancers'][:, 1]
+    }), index=False).to_numpy()
+    entries = pd.DataFrame({'dancer': table['rating_dancers'], 'rating': table['rating_values']})
+    np.add.at(signatures, table['rating_rows'], pd.util.hash_pandas_object(entries, index=False).to_numpy())
+    return signatures
+
+def changed_inputs(model, cache_dir):
+    """Dancers and dances whose input rows changed since the last saved run
+    
+    Compares the current parsed CSVs with the last run's, which the parse
+    cache keeps. Returns (dancer names, dance names), or None if the last
+    run's inputs are not in the cache.
+    """
+    last_run = read_last_run(cache_dir)
+    changed = []
+    for kind, signatures in (('dancers', dancer_signatures), ('dances', dance_signatures)):
+        digest = model['input_digests'][kind]
+        if last_run.get(kind) == digest:
+            changed.append(set())
+            continue
+        old = read_cached_table(cache_dir, kind, last_run.get(kind))
+        new = read_cached_table(cache_dir, kind, digest)
+        if old is None or new is None:
+            return None
+        
+        # Rows are matched by name; new, removed and edited rows all count as changed
+        matched = pd.Index(old['names']).get_indexer(new['names'])
+        known = matched >= 0
+        same = np.zeros(len(matched), dtype=bool)
+        same[known] = signatures(old)[matched[known]] == signatures(new)[known]
+        removed = pd.Index(new['names']).get_indexer(old['names']) < 0
+        changed.append(set(new['names'][~same].tolist()) | set(old['names'][removed].tolist()))
+    return tuple(changed)
+
+def keep_previous_assignments(dancers, dances, model, previous, excluded_dancers=(), values=None):
+    """Re-apply the previous (dance, dancer) placements that are still allowed and return the ones dropped"""
+    if values is None:
+        values = placement_values(model)
+    
+    # Where a dance shrank, the previous members whose loss costs the objective
+    # least make way: their placement value, plus the coverage bonus if it is
+    # the last placement they would keep
+    members = {}
+    kept = {}
+    for dance, dancer in dict.fromkeys(previous):
+        if (dance in dances and dancer in dancers and dancer not in excluded_dancers and
+                values[dancers[dancer].id, dances[dance].id] > 0):
+            members.setdefault(dance, []).append(dancer)
+            kept[dancer] = kept.get(dancer, 0) + 1
+    surplus = set()
+    for dance, names in members.items():
+        extra = len(names) - dances[dance].max_dancers[1]
+        if extra > 0:
+            j = dances[dance].id
+            ranked = sorted(names, key=lambda dancer: (values[dancers[dancer].id, j] +
+                                                       COVERAGE_BONUS * (kept[dancer] == 1)))
+            for dancer in ranked[:extra]:
+                surplus.add((dance, dancer))
+                kept[dancer] -= 1
+    
+    # Each dancer's remaining placements are offered until no more fit, so a
+    # placement listed before the dance it requires is kept too
+    pending = {}
+    for dance, names in members.items():
+        for dancer in names:
+            if (dance, dancer) not in surplus:
+                pending.setdefault(dancer, []).append(dance)
+    for dancer, dance_list in pending.items():
+        add_while_possible(dancer, dance_list, dancers, dances, model)
+    for dance, names in members.items():
+        current = dances[dance].current_dancers
+        dances[dance].current_dancers = dict.fromkeys([dancer for dancer in names if dancer in current] + list(current))
+    return [(dance, dancer) for dance, dancer in dict.fromkeys(previous)
+            if not (dance in dances and dancer in dancers and dancer in dances[dance].current_dancers)]
+
+def assign_dancers_incremental(dancers, dances, model, previous, changed_dancers=(), changed_dances=(),
+                               previous_order=None):
+    """Repair a previous assignment after an edit to the inputs, disturbing as few placements as possible
+    
+    Returns the placements (dance, dancer) added and removed relative to previous.
+    """
+    excluded_dancers = identify_excluded_dancers(model)
+    values = placement_values(model)
+    affected_dancers = {dancer for dancer in changed_dancers if dancer in dancers}
+    affected_dances = {dance for dance in changed_dances if dance in dances}
+    
+    # Keep the previous placements that are still valid
+    for dance, dancer in keep_previous_assignments(dancers, dances, model, previous, excluded_dancers, values):
+        if dance in dances:
+            affected_dances.add(dance)
+        if dancer in dancers:
+            affected_dancers.add(dancer)
+    # previous_order ({dancer: [dances]}) restores the order each dancer's dances were listed in
+    for dancer, order in (previous_order or {}).items():
+        if dancer in dancers and dancers[dancer].current_dances:
+            current = dancers[dancer].current_dances
+            dancers[dancer].current_dances = dict.fromkeys([dance for dance in order if dance in current] + list(current))
+    
+    # Give affected dancers left without a dance their most valuable open one
+    for dancer in affected_dancers:
+        if dancer in excluded_dancers or dancers[dancer].current_dances:
+            continue
+        row = values[dancers[dancer].id]
+        for j in np.argsort(-row, kind='stable')[:np.count_nonzero(row)]:
+            if can_add_dancer(dancer, model['dance_names'][j], dancers, dances, model):
+                add_assignment(dancer, model['dance_names'][j], dancers, dances)
+                break
+    
+    # Repair locally, starting from the affected dances in show-file order
+    for dancer in affected_dancers:
+        affected_dances.update(model['dance_names'][j] for j in np.flatnonzero(values[dancers[dancer].id]))
+    optimize_assignments(dancers, dances, model, excluded_dancers,
+                         start_dances=[dance for dance in dances if dance in affected_dances])
+    warn_unassigned(dancers, excluded_dancers)
+    
+    current = [(dance, dancer) for dance in dances for dancer in dances[dance].current_dancers]
+    previous_set = set(previous)
+    current_set = set(current)
+    added = [placement for placement in current if placement not in previous_set]
+    removed = [placement for placement in dict.fromkeys(previous) if placement not in current_set]
+    return added, removed
+
+def resolve_incremental(dancers, dances, model, cache_dir):
+    """Run assign_dancers_incremental against the saved results, or return None if a full solve is needed"""
+    previous = read_previous_assignments()
+    if previous is None:
+        print("Warning: No previous dance_assignments.csv to update; solving from scratch")
+        return None
+    if cache_dir is None:
+        print("Warning: Incremental runs need the parse cache; solving from scratch")
+        return None
+    changed = changed_inputs(model, cache_dir)
+    if changed is None:
+        print("Warning: The previous run's inputs are not in the parse cache; solving from scratch")
+        return None
+    changed_dancers, changed_dances = changed
+    print(f"Incremental run: {len(changed_dancers)} dancer row(s) and {len(changed_dances)} dance row(s) changed")
+    return assign_dancers_incremental(dancers, dances, model, previous, changed_dancers, changed_dances,
+                                      read_previous_dance_order())
+
+def dance_overlap(dances, model):
+    """Dance×dance counts of shared dancers, computed as the incidence product A·Aᵀ"""
+    rows, cols = [], []
+    for dance in dances:
+        for dancer in dances[dance].current_dancers:
+            rows.append(dances[dance].id)
+            cols.append(model['dancer_ids'][dancer])
+    incidence = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                                  shape=(len(model['dance_names']), len(model['dancer_names'])))
+    overlap = (incidence @ incidence.T).toarray()
+    np.fill_diagonal(overlap, 0)
+    return overlap
+
+def order_cost(order, overlap, min_gap=1):
+    """Penalty for dancers performing again with fewer than min_gap dances in between
+    
+    A pair of dances d positions apart costs (min_gap - d + 1) per shared
+    dancer, so back-to-back pairs cost the most. With min_gap=1 this is the
+    number of quick changes.
+    """
+    order = np.asarray(order, dtype=np.int64)
+    cost = 0
+    for gap in range(1, min(min_gap, len(order) - 1) + 1):
+        cost += (min_gap - gap + 1) * overlap[order[:-gap], order[gap:]].sum()
+    return int(cost)
+
+def held_karp_order(cost):
+    """Exact cheapest path through every dance, paying cost[a, b] when b follows a"""
+    n = len(cost)
+    full = 1 << n
+    best = np.full((full, n), np.inf)
+    parent = np.full((full, n), -1, dtype=np.int64)
+    best[1 << np.arange(n), np.arange(n)] = 0
+    
+    for mask in range(1, full):
+        # Extend the best path over `mask` ending at each dance by every dance outside it
+        step = best[mask][:, None] + cost
+        previous = step.argmin(axis=0)
+        outside = np.array([k for k in range(n) if not mask & (1 << k)], dtype=np.int64)
+        if len(outside) == 0:
+            continue
+        extended = mask | (1 << outside)
+        values = step[previous[outside], outside]
+        better = values < best[extended, outside]
+        best[extended[better], outside[better]] = values[better]
+        parent[extended[better], outside[better]] = previous[outside[better]]
+    
+    # Walk back from the cheapest finishing dance
+    mask, last = full - 1, int(best[full - 1].argmin())
+    order = []
+    while last >= 0:
+        order.append(last)
+        mask, last = mask & ~(1 << last), int(parent[mask, last])
+    return order[::-1]
+
+def two_opt_order(order, cost):
+    """Reverse segments of the path while that lowers the cost of adjacent pairs"""
+    order = list(order)
+    n = len(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n - 1):
+            # Reversing order[i..j] only changes the pairs at its two ends
+            path = np.array(order)
+            j = np.arange(i + 1, n)
+            after_j = path[np.minimum(j + 1, n - 1)]
+            has_next = j < n - 1
+            before = np.where(has_next, cost[path[j], after_j], 0)
+            after = np.where(has_next, cost[path[i], after_j], 0)
+            if i > 0:
+                before = before + cost[path[i - 1], path[i]]
+                after = after + cost[path[i - 1], path[j]]
+            k = int(np.argmin(after - before))
+            if after[k] < before[k]:
+                order[i:j[k] + 1] = order[i:j[k] + 1][::-1]
+                improved = True
+    return order
+
+def or_opt_order(order, overlap, min_gap, max_segment=3, deadline=None):
+    """Move runs of up to max_segment dances elsewhere while that lowers order_cost"""
+    order = list(order)
+    best = order_cost(order, overlap, min_gap)
+    improved = True
+    while improved and best > 0:
+        improved = False
+        for length in range(1, max_segment + 1):
+            for i in range(len(order) - length + 1):
+                segment, rest = order[i:i + length], order[:i] + order[i + length:]
+                for pos in range(len(rest) + 1):
+                    if deadline is not None and time.perf_counter() > deadline:
+                        return order
+                    if pos == i:
+                        continue
+                    candidate = rest[:pos] + segment + rest[pos:]
+                    cost = order_cost(candidate, overlap, min_gap)
+                    if cost < best:
+                        order, best, improved = candidate, cost, True
+                        break
+    return order
+
+def create_show_order(dances, model, min_gap=1, time_limit=SHOW_ORDER_TIME_LIMIT, overlap=None):
+    """Create optimal show order to minimize quick changes
+    
+    Small shows are ordered exactly with Held-Karp on back-to-back shared
+    dancers; larger ones start from a nearest-neighbour path improved with
+    2-opt. If min_gap > 1, Or-opt then refines the order against the full
+    gap penalty within time_limit seconds. overlap (from dance_overlap) can
+    be passed in when the caller has already computed it.
+    """
+    if overlap is None:
+        overlap = dance_overlap(dances, model)
+    n = len(overlap)
+    if n < 2 or min_gap < 1:
+        return list(dances)
+    deadline = time.perf_counter() + time_limit
+    
+    if n <= HELD_KARP_MAX_DANCES:
+        order = held_karp_order(overlap)
+    else:
+        # Nearest neighbour: always follow with the dance sharing the fewest dancers
+        order = [int(overlap.sum(axis=1).argmin())]
+        remaining = np.ones(n, dtype=bool)
+        remaining[order[0]] = False
+        for _ in range(n - 1):
+            next_dance = int(np.where(remaining, overlap[order[-1]], np.iinfo(overlap.dtype).max).argmin())
+            order.append(next_dance)
+            remaining[next_dance] = False
+        order = two_opt_order(order, overlap)
+    
+    if min_gap > 1:
+        order = or_opt_order(order, overlap, min_gap, deadline=deadline)
+    
+    return [model['dance_names'][j] for j in order]
+
+def quick_changes(show_order, dances):
+    """Number of dancers each dance shares with the one before it in the show"""
+    changes = [0] if show_order else []
+    for previous, dance in zip(show_order, show_order[1:]):
+        changes.append(len(dances[previous].current_dancers.keys() &
+                           dances[dance].current_dancers.keys()))
+    return changes
+
+def result_tables(dancers, dances, show_order, model):
+    """The dance-centric, dancer-centric and show order results as DataFrames, keyed by file stem
+    
+    Each table is built column by column from the id arrays of the placements
+    (one ratings lookup for all rows) instead of one dict per row.
+    Assigned_Dances is a list of dance names per dancer; save_results joins
+    it with commas for the CSV.
+    """
+    rows, cols = assignment_indices(dancers, dances)
+    dance_assignments = pd.DataFrame({
+        'Dance': np.array(model['dance_names'], dtype=object)[cols],
+        'Dancer': np.array(model['dancer_names'], dtype=object)[rows],
+        'Rating': model['ratings'][rows, cols].astype(np.int64)
+    })
+    assigned = [list(dancers[dancer].current_dances) for dancer in dancers]
+    dancer_assignments = pd.DataFrame({
+        'Dancer': list(dancers),
+        'Assigned_Dances': assigned,
+        'Number_of_Dances': np.array([len(dance_list) for dance_list in assigned], dtype=np.int64)
+    })
+    show_order_table = pd.DataFrame({'Order': range(1, len(show_order) + 1),
+                                     'Dance': show_order,
+                                     'Quick_Changes': quick_changes(show_order, dances)})
+    return {'dance_assignments': dance_assignments, 'dancer_assignments': dancer_assignments,
+            'show_order': show_order_table}
+
+def conflict_bitsets(overlap):
+    """Each dance's conflicts as an integer bitset: bit k is set if it shares a dancer with dance k"""
+    packed = np.packbits(overlap > 0, axis=1, bitorder='little')
+    return [int.from_bytes(row.tobytes(), 'little') for row in packed]
+
+def bit_indices(bits):
+    """Positions of the set bits of an integer, lowest first"""
+    indices = []
+    while bits:
+        low = bits & -bits
+        indices.append(low.bit_length() - 1)
+        bits ^= low
+    return indices
+
+def schedule_rehearsals(dances, model, rooms=None, slot_capacity=None, overlap=None,
+                        time_limit=REHEARSAL_TIME_LIMIT):
+    """Put every dance in a rehearsal time slot so no dancer is booked twice, using as few slots as possible
+    
+    Returns the slots as lists of dance names, one per room.
+    """
+    if overlap is None:
+        overlap = dance_overlap(dances, model)
+    n = len(model['dance_names'])
+    names = model['dance_names']
+    conflicts = conflict_bitsets(overlap)
+    sizes = [0] * n
+    for dance in dances:
+        sizes[dances[dance].id] = len(dances[dance].current_dancers)
+    rooms = rooms or n
+    slot_capacity = slot_capacity if slot_capacity is not None else sum(sizes)
+    too_big = [names[j] for j in range(n) if sizes[j] > slot_capacity]
+    if too_big:
+        raise ValueError(f"Dance(s) {', '.join(too_big)} have more dancers than a slot can hold ({slot_capacity})")
+    
+    # Each slot is a bitset of its dances, with its dance count and dancer load
+    members, counts, loads = [], [], []
+    slot_of = [-1] * n
+    
+    def fits(j, s):
+        return (not conflicts[j] & members[s] and counts[s] < rooms
+                and loads[s] + sizes[j] <= slot_capacity)
+    
+    def place(j, s):
+        if s == len(members):
+            members.append(0)
+            counts.append(0)
+            loads.append(0)
+        members[s] |= 1 << j
+        counts[s] += 1
+        loads[s] += sizes[j]
+        slot_of[j] = s
+    
+    def unplace(j):
+        s = slot_of[j]
+        members[s] &= ~(1 << j)
+        counts[s] -= 1
+        loads[s] -= sizes[j]
+        slot_of[j] = -1
+    
+    # DSATUR: blocked[j] is a bitset of the slots holding one of j's conflicts
+    degree = [bin(bits).count('1') for bits in conflicts]
+    blocked = [0] * n
+    unplaced = set(range(n))
+    while unplaced:
+        j = max(unplaced, key=lambda k: (bin(blocked[k]).count('1'), degree[k], -k))
+        unplaced.discard(j)
+        s = next((s for s in range(len(members)) if fits(j, s)), len(members))
+        place(j, s)
+        for k in bit_indices(conflicts[j]):
+            blocked[k] |= 1 << s
+    
+    # Local search: empty the smallest slot by moving its dances elsewhere
+    deadline = time.perf_counter() + time_limit
+    
+    def relocate(j, avoid, depth=2):
+        """Place j in a slot outside avoid, first moving one dance out of its way if needed (recursively)"""
+        for s in range(len(members)):
+            if s not in avoid and fits(j, s):
+                place(j, s)
+                return True
+        if depth == 0 or time.perf_counter() > deadline:
+            return False
+        for s in range(len(members)):
+            in_the_way = conflicts[j] & members[s]
+            if s in avoid or in_the_way & (in_the_way - 1):
+                continue
+            # The one conflicting dance, or any member if only the room or capacity limit is in the way
+            for k in bit_indices(in_the_way or members[s]):
+                unplace(k)
+                if fits(j, s):
+                    place(j, s)
+                    if relocate(k, avoid | {s}, depth - 1):
+                        return True
+                    unplace(j)
+                place(k, s)
+        return False
+    
+    bound = rehearsal_lower_bound(dances, model, rooms, slot_capacity)
+    failed = set()
+    while len(members) > max(bound, 1) and time.perf_counter() < deadline:
+        candidates = [s for s in range(len(members)) if s not in failed]
+        if not candidates:
+            break
+        target = min(candidates, key=lambda s: (counts[s], -s))
+        saved = (list(members), list(counts), list(loads), list(slot_of))
+        moved = True
+        for j in bit_indices(members[target]):
+            unplace(j)
+            if not relocate(j, {target}):
+                moved = False
+                break
+        if not moved:
+            members[:], counts[:], loads[:], slot_of[:] = saved
+            failed.add(target)
+            continue
+        
+        # Drop the emptied slot and renumber the ones after it
+        del members[target], counts[target], loads[target]
+        slot_of[:] = [s - (s > target) for s in slot_of]
+        failed = set()
+    
+    return [[names[j] for j in bit_indices(bits)] for bits in members]
+
+def rehearsal_lower_bound(dances, model, rooms=None, slot_capacity=None):
+    """Fewest time slots any rehearsal schedule needs
+    
+    A dancer in k dances needs k different slots, and the slots must also
+    have enough rooms and capacity for every dance.
+    """
+    rows = [model['dancer_ids'][dancer] for dance in dances for dancer in dances[dance].current_dancers]
+    bound = int(np.bincount(rows).max()) if rows else 0
+    if rooms:
+        bound = max(bound, -(-len(dances) // rooms))
+    if slot_capacity:
+        bound = max(bound, -(-len(rows) // slot_capacity))
+    return bound
+
+def rehearsal_table(schedule, dances):
+    """The rehearsal schedule as a Slot/Room/Dance/Dancers table"""
+    return pd.DataFrame([(slot, room, dance, len(dances[dance].current_dancers))
+                         for slot, slot_dances in enumerate(schedule, start=1)
+                         for room, dance in enumerate(slot_dances, start=1)],
+                        columns=['Slot', 'Room', 'Dance', 'Dancers'])
+
+def save_results(dancers, dances, show_order, model, parquet=False, directory='.'):
+    """Save results to CSV files in directory (and Parquet files with the same names, if parquet is set)
+    
+    In the Parquet files Assigned_Dances stays a list column, so other tools
+    can load the results without splitting strings. Parquet needs pyarrow.
+    """
+    tables = result_tables(dancers, dances, show_order, model)
+    if parquet:
+        for name, table in tables.items():
+            table.to_parquet(os.path.join(directory, f'{name}.parquet'), engine='pyarrow', index=False)
+    tables['dancer_assignments']['Assigned_Dances'] = [','.join(dance_list) for dance_list in
+                                                       tables['dancer_assignments']['Assigned_Dances']]
+    for name, table in tables.items():
+        table.to_csv(os.path.join(directory, f'{name}.csv'), index=False)
+
+def save_changes(added, removed, path='assignment_changes.csv'):
+    """Save the placements an incremental run added and removed"""
+    changes = pd.DataFrame([('added', dance, dancer) for dance, dancer in added] +
+                           [('removed', dance, dancer) for dance, dancer in removed],
+                           columns=['Change', 'Dance', 'Dancer'])
+    changes.to_csv(path, index=False)
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Assign dancers to dances and order the show")
+    parser.add_argument('--solver', choices=sorted(SOLVERS), default='greedy',
+                        help="assignment engine to use (default: greedy)")
+    parser.add_argument('--min-gap', type=int, default=1,
+                        help="dances a dancer should have off before performing again (default: 1, no back-to-back)")
+    parser.add_argument('--starts', type=int, default=MULTISTART_STARTS,
+                        help=f"randomized starts for the multistart solver (default: {MULTISTART_STARTS})")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes for the multistart solver, scenarios and batches (default: one per CPU)")
+    parser.add_argument('--rehearsals', action='store_true',
+                        help="also schedule rehearsals into time slots so no dancer is booked twice")
+    parser.add_argument('--rooms', type=int, default=None,
+                        help="dances that can rehearse at the same time (default: no limit)")
+    parser.add_argument('--slot-capacity', type=int, default=None,
+                        help="dancers that can rehearse at the same time (default: no limit)")
+    parser.add_argument('--time-budget', type=float, default=ANYTIME_TIME_LIMIT, metavar='SECONDS',
+                        help=f"wall-clock budget of the anytime solver (default: {ANYTIME_TIME_LIMIT:g})")
+    parser.add_argument('--profile', metavar='PATH', default=None,
+                        help="write a JSON run profile (check counts, rejections and timings) to PATH")
+    parser.add_argument('--compare', action='store_true',
+                        help="also run the other solvers and print every objective value")
+    parser.add_argument('--incremental', action='store_true',
+                        help="update the previous dance_assignments.csv for the edited inputs instead of solving from scratch")
+    parser.add_argument('--scenarios', metavar='PATH', default=None,
+                        help="compare the what-if scenarios in a JSON file instead of saving one solution")
+    parser.add_argument('--batch', metavar='PATH', default=None,
+                        help="solve every show listed in a JSON manifest, each into its own directory")
+    parser.add_argument('--no-cache', action='store_true',
+                        help=f"always re-parse the CSVs instead of using the parse cache in {CACHE_DIR}")
+    parser.add_argument('--parquet', action='store_true',
+                        help="also save the results as Parquet files (needs pyarrow)")
+    args = parser.parse_args(argv)
+    if args.parquet and importlib.util.find_spec('pyarrow') is None:
+        parser.error("--parquet needs pyarrow (pip install pyarrow)")
+    if args.profile and args.solver == 'multistart':
+        parser.error("--profile does not work with --solver multistart, whose starts run in worker processes")
+    
+    # Batches and scenario comparisons skip the single-run steps, so refuse the options they would ignore
+    single_run = {'--rehearsals': args.rehearsals, '--incremental': args.incremental,
+                  '--profile': args.profile, '--compare': args.compare}
+    ignored = [option for option, value in single_run.items() if value]
+    for mode, path in (('--batch', args.batch), ('--scenarios', args.scenarios)):
+        if path and ignored:
+            parser.error(f"{mode} cannot be combined with {', '.join(ignored)}")
+    if args.batch and args.scenarios:
+        parser.error("--batch cannot be combined with --scenarios")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    solver_options = {'multistart': {'starts': args.starts, 'workers': args.workers},
+                      'anytime': {'time_limit': args.time_budget}}
+    cache_dir = None if args.no_cache else CACHE_DIR
+    objectives = {}
+    changes = None
+    
+    if args.batch:
+        shows = load_manifest(args.batch)
+        for show in shows:
+            show.setdefault('solver', args.solver)
+            show.setdefault('min_gap', args.min_gap)
+        start = time.perf_counter()
+        summary = solve_batch(shows, workers=args.workers, cache=cache_dir is not None,
+                              parquet=args.parquet, solver_options=solver_options)
+        print("\nBatch Summary:")
+        print(summary.to_string(index=False))
+        print(f"\n{len(summary)} show(s) in {time.perf_counter() - start:.2f}s "
+              f"({summary['Total_Seconds'].sum():.2f}s of solving)")
+        summary.to_csv('batch_summary.csv', index=False)
+        print("\nResults saved to each show's output directory; summary saved to 'batch_summary.csv'")
+        return
+    
+    if args.scenarios:
+        dancers, dances, model = load_data(cache_dir)
+        comparison = evaluate_scenarios(dancers, dances, model, load_scenarios(args.scenarios),
+                                        workers=args.workers, min_gap=args.min_gap)
+        print("\nScenario Comparison:")
+        print(comparison.to_string(index=False))
+        comparison.to_csv('scenario_comparison.csv', index=False)
+        print("\nResults saved to 'scenario_comparison.csv'")
+        return
+    
+    with profiled() if args.profile else contextlib.nullcontext() as profile:
+        # Load data
+        with profile_stage('load_data'):
+            dancers, dances, model = load_data(cache_dir)
+        if args.compare:
+            blank_dancers, blank_dances = copy.deepcopy(dancers), copy.deepcopy(dances)
+        
+        # Check what any assignment could achieve
+        with profile_stage('diagnose_feasibility'):
+            with contextlib.redirect_stdout(io.StringIO()):
+                excluded_dancers = identify_excluded_dancers(model)
+            diagnose_feasibility(dancers, dances, model, excluded_dancers)
+        
+        # Make assignments, repairing the previous ones if asked to
+        if args.incremental:
+            with profile_stage('incremental'):
+                changes = resolve_incremental(dancers, dances, model, cache_dir)
+        solver = args.solver if changes is None else 'incremental'
+        if changes is None:
+            with profile_stage(solver):
+                SOLVERS[solver](dancers, dances, model, **solver_options.get(solver, {}))
+        objectives[solver] = assignment_objective(dancers, dances, model)
+        
+        # Generate show order (and rehearsal slots) from the shared-dancer counts
+        with profile_stage('create_show_order'):
+            overlap = dance_overlap(dances, model)
+            show_order = create_show_order(dances, model, min_gap=args.min_gap, overlap=overlap)
+        if args.rehearsals:
+            with profile_stage('schedule_rehearsals'):
+                schedule = schedule_rehearsals(dances, model, rooms=args.rooms, slot_capacity=args.slot_capacity,
+                                               overlap=overlap)
+        
+        # Save results
+        with profile_stage('save_results'):
+            save_results(dancers, dances, show_order, model, parquet=args.parquet)
+            if args.rehearsals:
+                rehearsal_table(schedule, dances).to_csv('rehearsal_schedule.csv', index=False)
+            if changes is not None:
+                save_changes(*changes)
+            if cache_dir is not None:
+                record_last_run(cache_dir, model['input_digests'])
+    
+    if args.profile:
+        profile['solver'] = solver
+        profile['objective'] = objectives[solver]
+        with open(args.profile, 'w') as f:
+            json.dump(profile, f, indent=2)
+    
+    # Solve the other engines on fresh copies for comparison
+    if args.compare:
+        for name, other_solver in SOLVERS.items():
+            if name != solver:
+                other_dancers, other_dances = copy.deepcopy(blank_dancers), copy.deepcopy(blank_dances)
+                other_solver(other_dancers, other_dances, model, **solver_options.get(name, {}))
+                objectives[name] = assignment_objective(other_dancers, other_dances, model)
     
     # Print summary
     print("\nAssignments Summary:")
     for dance in dances:
         print(f"\n{dance}:")
-        print(f"Dancers: {', '.join(dances[dance]['current_dancers'])}")
-        print(f"Total: {len(dances[dance]['current_dancers'])}/{dances[dance]['max_dancers'][1]}")
+        print(f"Dancers: {', '.join(dances[dance].current_dancers)}")
+        print(f"Total: {len(dances[dance].current_dancers)}/{dances[dance].max_dancers[1]}")
     
     print("\nDancer Assignments:")
     for dancer in sorted(dancers.keys()):
-        if dancers[dancer]['current_dances']:
-            print(f"{dancer}: {', '.join(dancers[dancer]['current_dances'])} ({len(dancers[dancer]['current_dances'])} dances)")
+        if dancers[dancer].current_dances:
+            print(f"{dancer}: {', '.join(dancers[dancer].current_dances)} ({len(dancers[dancer].current_dances)} dances)")
     
     print("\nShow Order:")
     print(" -> ".join(show_order))
+    print(f"Quick changes: {sum(quick_changes(show_order, dances))}")
+    
+    if args.rehearsals:
+        print("\nRehearsal Schedule:")
+        for slot, slot_dances in enumerate(schedule, start=1):
+            print(f"Slot {slot}: {', '.join(slot_dances)}")
+        bound = rehearsal_lower_bound(dances, model, rooms=args.rooms, slot_capacity=args.slot_capacity)
+        print(f"Time slots: {len(schedule)} (at least {bound} needed)")
+    
+    if changes is not None:
+        added, removed = changes
+        print(f"\nChanged placements: {len(added)} added, {len(removed)} removed")
+        for label, placements in (('+', added), ('-', removed)):
+            for dance, dancer in placements:
+                print(f"{label} {dancer} in {dance}")
+    
+    scores = score_assignments(assignment_matrix(dancers, dances, model), dancers, dances, model, excluded_dancers)
+    print("\nAssignment Quality:")
+    print(f"- placements: {scores['placements']}, mean rating {scores['mean_rating']:.2f}")
+    print(f"- on \"most\" dances: {scores['most_share']:.1%}, \"okay\": {scores['okay_share']:.1%}, "
+          f"other: {scores['other_share']:.1%}")
+    print(f"- unassigned dancers: {scores['unassigned']}, below their range: {scores['under_range']}, "
+          f"above it: {scores['over_range']}")
+    print(f"- dances below their minimum size: {scores['dances_under_min']}")
+    
+    print("\nObjective:")
+    for name, objective in objectives.items():
+        marker = " (used)" if name == solver else ""
+        print(f"- {name}: {objective}{marker}")
     
     print("\nResults saved to:")
     print("- 'dance_assignments.csv' (dance-centric view)")
     print("- 'dancer_assignments.csv' (dancer-centric view)")
     print("- 'show_order.csv'")
+    if args.parquet:
+        print("- 'dance_assignments.parquet', 'dancer_assignments.parquet', 'show_order.parquet'")
+    if args.rehearsals:
+        print("- 'rehearsal_schedule.csv'")
+    if changes is not None:
+        print("- 'assignment_changes.csv' (placements added and removed)")
+    if args.profile:
+        print(f"- '{args.profile}' (run profile)")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
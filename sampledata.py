@@ -1,93 +1,209 @@
-import random
+import argparse
+import numpy as np
 import pandas as pd
 
-def generate_random_preferences(dance_list, min_most=1, max_most=4, min_okay=2, max_okay=6, min_no=0, max_no=3):
+# Categories for each dancer's experience and desired number of dances
+EXPERIENCE_LEVELS = ['none', 'beginner', 'intermediate', 'advanced']
+DANCE_RANGES = ['1-2', '2-3', '3-4', '4-5', '5+']
+
+# Number of dancers given each rating, as a share of the dancers a dance needs
+RATING_SHARES = {5: 0.5, 4: 0.7, 3: 1.0, 2: 0.7, 1: 0.3}
+
+# Dancers generated and written per chunk, which bounds memory
+CHUNK_ROWS = 50_000
+
+# Random keys drawn at once when sampling from a short dance list
+KEY_BLOCK = 1 << 20
+
+def dancer_name(i):
+    """Name of the i-th generated dancer (0-based)"""
+    return f"name{i + 1}"
+
+def random_partial_permutations(rng, num_rows, num_items, take):
+    """First `take` entries of an independent random permutation of range(num_items) per row"""
+    if num_items <= take * take:
+        # Few items: sort random keys and keep the `take` smallest, in key order,
+        # a block of rows at a time so the keys stay small
+        blocks = []
+        block_rows = max(1, KEY_BLOCK // num_items)
+        for start in range(0, num_rows, block_rows):
+            keys = rng.random((min(block_rows, num_rows - start), num_items))
+            picked = np.argpartition(keys, take - 1, axis=1)[:, :take]
+            blocks.append(np.take_along_axis(picked, np.take_along_axis(keys, picked, axis=1).argsort(axis=1), axis=1))
+        return np.concatenate(blocks) if blocks else np.empty((0, take), dtype=np.int64)
+
+    # Many items: draw with replacement and redraw the (few) rows that repeat an item
+    picked = rng.integers(0, num_items, size=(num_rows, take))
+    while True:
+        ordered = np.sort(picked, axis=1)
+        repeats = (ordered[:, 1:] == ordered[:, :-1]).any(axis=1)
+        if not repeats.any():
+            return picked
+        picked[repeats] = rng.integers(0, num_items, size=(int(repeats.sum()), take))
+
+def random_counts(rng, low, high, available):
+    """Draw one count per row uniformly from low..min(high, available)"""
+    high = np.minimum(high, available)
+    low = np.minimum(low, high)
+    return rng.integers(low, high + 1)
+
+def generate_random_preferences(rng, num_rows, dance_list, min_most=1, max_most=4, min_okay=2, max_okay=6, min_no=0, max_no=3):
     """
-    Generate random preferences from a list of dances.
-    
+    Generate random preferences for a batch of dancers.
+
+    Each row's "most", "no" and "okay" dances are consecutive runs of the
+    same random permutation of the dances, so the lists never overlap.
+
     Parameters:
+    - rng: numpy random Generator
+    - num_rows: Number of dancers in the batch
     - dance_list: List of all possible dances
     - min_most/max_most: Range for number of "most wanted" dances
     - min_okay/max_okay: Range for number of "okay with" dances
     - min_no/max_no: Range for number of "do not want" dances
-    
+
     Returns:
-    - Dictionary with most, okay, and no lists
+    - Dictionary with most, okay, and no columns (lists of comma-separated strings)
     """
-    # Create a copy of the dance list to work with
-    available_dances = dance_list.copy()
-    
+    num_dances = len(dance_list)
+
     # Randomly select number of dances for each category
-    num_most = random.randint(min_most, min(max_most, len(available_dances)))
-    
-    # Select "most" dances
-    most_dances = random.sample(available_dances, num_most)
-    # Remove selected dances from available pool
-    for dance in most_dances:
-        available_dances.remove(dance)
-    
-    # Select "no" dances from remaining
-    num_no = random.randint(min_no, min(max_no, len(available_dances)))
-    no_dances = random.sample(available_dances, num_no)
-    # Remove selected dances from available pool
-    for dance in no_dances:
-        available_dances.remove(dance)
-    
-    # Select "okay" dances from remaining
-    num_okay = random.randint(min_okay, min(max_okay, len(available_dances)))
-    okay_dances = random.sample(available_dances, num_okay)
-    
-    return {
-        'most': ','.join(most_dances),
-        'okay': ','.join(okay_dances),
-        'no': ','.join(no_dances)
-    }
+    available = np.full(num_rows, num_dances)
+    num_most = random_counts(rng, min_most, max_most, available)
+    num_no = random_counts(rng, min_no, max_no, available - num_most)
+    num_okay = random_counts(rng, min_okay, max_okay, available - num_most - num_no)
+
+    take = min(num_dances, max_most + max_no + max_okay)
+    if take == 0:
+        empty = [''] * num_rows
+        return {'most': empty, 'okay': empty, 'no': empty}
+    picked = random_partial_permutations(rng, num_rows, num_dances, take)
+    rows = np.asarray(dance_list, dtype=object)[picked].tolist()
 
-def generate_random_ratings(all_dancers, num_dancers_needed):
+    bounds = zip(rows, num_most.tolist(), (num_most + num_no).tolist(), (num_most + num_no + num_okay).tolist())
+    most, no, okay = [], [], []
+    for row, end_most, end_no, end_okay in bounds:
+        most.append(','.join(row[:end_most]))
+        no.append(','.join(row[end_most:end_no]))
+        okay.append(','.join(row[end_no:end_okay]))
+
+    return {'most': most, 'okay': okay, 'no': no}
+
+def generate_random_ratings(rng, num_dancers, num_dancers_needed, rating_shares=RATING_SHARES):
     """
-    Generate random ratings for dancers.
-    
+    Generate random ratings for a dance.
+
     Parameters:
-    - all_dancers: List of all possible dancers
+    - rng: numpy random Generator
+    - num_dancers: Number of dancers (rated by their generated names)
     - num_dancers_needed: Number of dancers needed for this dance
-    
+    - rating_shares: Dancers given each rating, as a share of num_dancers_needed
+
     Returns:
-    - Dictionary with ratings 1-5, each containing a list of dancers
+    - Dictionary with Rating_5 to Rating_1, each a comma-separated list of dancers
     """
-    # Create a copy of the dancer list to work with
-    available_dancers = all_dancers.copy()
-    
-    # Distribute dancers across ratings, with higher ratings getting more dancers
-    ratings = {5: [], 4: [], 3: [], 2: [], 1: []}
-    
-    # Distribution weights (higher ratings get more dancers)
-    distribution = {
-        5: int(num_dancers_needed * 0.5),  # 50% of needed dancers
-        4: int(num_dancers_needed * 0.7),  # 70% of needed dancers
-        3: int(num_dancers_needed * 1.0),  # 100% of needed dancers
-        2: int(num_dancers_needed * 0.7),  # 70% of needed dancers
-        1: int(num_dancers_needed * 0.3),  # 30% of needed dancers
-    }
-    
-    # Assign random dancers to each rating
-    for rating in range(5, 0, -1):
-        num_to_select = min(distribution[rating], len(available_dancers))
-        selected_dancers = random.sample(available_dancers, num_to_select)
-        ratings[rating] = selected_dancers
-        
-        # Remove selected dancers from available pool
-        for dancer in selected_dancers:
-            available_dancers.remove(dancer)
-    
-    return {
-        'Rating_5': ','.join(ratings[5]),
-        'Rating_4': ','.join(ratings[4]),
-        'Rating_3': ','.join(ratings[3]),
-        'Rating_2': ','.join(ratings[2]),
-        'Rating_1': ','.join(ratings[1])
-    }
+    # Higher ratings are filled first; no dancer gets two ratings
+    sizes = [int(num_dancers_needed * rating_shares[rating]) for rating in range(5, 0, -1)]
+    ends = np.minimum(np.cumsum(sizes), num_dancers)
+    selected = rng.choice(num_dancers, size=int(ends[-1]), replace=False).tolist()
+
+    ratings = {}
+    start = 0
+    for rating, end in zip(range(5, 0, -1), ends.tolist()):
+        ratings[f'Rating_{rating}'] = ','.join(dancer_name(i) for i in selected[start:end])
+        start = end
+    return ratings
+
+def write_dancer_preferences(path, num_dancers, dance_list, rng, experience_weights=None, range_weights=None, chunk_size=None):
+    """
+    Stream randomly generated dancer preferences to a CSV file in chunks.
+
+    Parameters:
+    - path: CSV file to write
+    - num_dancers: Number of dancers
+    - dance_list: List of all possible dances
+    - rng: numpy random Generator
+    - experience_weights: Probabilities for EXPERIENCE_LEVELS (default: uniform)
+    - range_weights: Probabilities for DANCE_RANGES (default: uniform)
+    - chunk_size: Dancers per chunk (default: CHUNK_ROWS)
+    """
+    chunk_size = chunk_size or CHUNK_ROWS
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for start in range(0, num_dancers, chunk_size) or [0]:
+            num_rows = min(chunk_size, num_dancers - start)
+            prefs = generate_random_preferences(rng, num_rows, dance_list)
+            chunk = pd.DataFrame({
+                'Name': [dancer_name(i) for i in range(start, start + num_rows)],
+                'Experience': rng.choice(EXPERIENCE_LEVELS, size=num_rows, p=experience_weights),
+                'Dances': rng.choice(DANCE_RANGES, size=num_rows, p=range_weights),
+                'Most': prefs['most'],
+                'Okay': prefs['okay'],
+                'No': prefs['no']
+            })
+            chunk.to_csv(f, header=start == 0, index=False)
+
+def write_choreographer_preferences(path, dances_with_sizes, num_dancers, rng, rating_shares=RATING_SHARES, chunk_size=1000):
+    """
+    Stream randomly generated choreographer ratings to a CSV file in chunks.
+
+    Parameters:
+    - path: CSV file to write
+    - dances_with_sizes: Dictionary of dance name -> number of dancers needed
+    - num_dancers: Number of dancers that can be rated
+    - rng: numpy random Generator
+    - rating_shares: Dancers given each rating, as a share of the dance's size
+    - chunk_size: Dances per chunk
+    """
+    dances = list(dances_with_sizes.items())
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for start in range(0, len(dances), chunk_size) or [0]:
+            choreo_data = []
+            for dance, size in dances[start:start + chunk_size]:
+                choreo_data.append({'Dance': dance, 'NumDancers': size,
+                                    **generate_random_ratings(rng, num_dancers, size, rating_shares)})
+            columns = ['Dance', 'NumDancers'] + [f'Rating_{rating}' for rating in range(5, 0, -1)]
+            pd.DataFrame(choreo_data, columns=columns).to_csv(f, header=start == 0, index=False)
+
+def generate_instance(num_dancers, num_dances, dancer_csv, choreo_csv, seed=None, min_size=6, max_size=12, **distributions):
+    """
+    Write a synthetic instance of any size (used by benchmark.py).
+
+    Parameters:
+    - num_dancers: Number of dancers (named name1, name2, ...)
+    - num_dances: Number of dances (named dance1, dance2, ...)
+    - dancer_csv/choreo_csv: CSV files to write
+    - seed: Random seed, so the same instance can be regenerated
+    - min_size/max_size: Range for the number of dancers each dance needs
+    - distributions: experience_weights, range_weights and rating_shares
+    """
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(min_size, max_size + 1, size=num_dances).tolist()
+    dances_with_sizes = {f"dance{j}": size for j, size in enumerate(sizes, start=1)}
+    write_dancer_preferences(dancer_csv, num_dancers, list(dances_with_sizes), rng,
+                             experience_weights=distributions.get('experience_weights'),
+                             range_weights=distributions.get('range_weights'))
+    write_choreographer_preferences(choreo_csv, dances_with_sizes, num_dancers, rng,
+                                    rating_shares=distributions.get('rating_shares', RATING_SHARES))
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Generate random dancer and choreographer preference CSVs")
+    parser.add_argument('--dancers', type=int, default=22, help="number of dancers (default: 22)")
+    parser.add_argument('--dances', type=int, default=None,
+                        help="number of generated dances (default: the 13 sample dances)")
+    parser.add_argument('--seed', type=int, default=None, help="random seed")
+    parser.add_argument('--experience-weights', type=float, nargs=len(EXPERIENCE_LEVELS), default=None,
+                        help=f"probabilities for {', '.join(EXPERIENCE_LEVELS)}")
+    parser.add_argument('--range-weights', type=float, nargs=len(DANCE_RANGES), default=None,
+                        help=f"probabilities for {', '.join(DANCE_RANGES)}")
+    parser.add_argument('--rating-shares', type=float, nargs=5, default=None,
+                        help="dancers rated 5, 4, 3, 2 and 1 as a share of each dance's size (default: 0.5 0.7 1.0 0.7 0.3)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = np.random.default_rng(args.seed)
 
-def main():
     # Chinese dance list with number of dancers needed
     dances_with_sizes = {
         "淡妆浓抹总相宜": 8,
@@ -104,54 +220,27 @@ def main():
         "只此青绿": 10,
         "玉鸟": 8
     }
-    
-    dances = list(dances_with_sizes.keys())
-    dancers = [f"name{i}" for i in range(1, 23)]
-    experience_levels = ['none', 'beginner', 'intermediate', 'advanced']
-    dance_ranges = ['1-2', '2-3', '3-4', '4-5', '5+']
-    
-    # Generate dancer preferences
-    dancer_data = []
-    for dancer in dancers:
-        prefs = generate_random_preferences(dances.copy())
-        dancer_data.append({
-            'Name': dancer,
-            'Experience': random.choice(experience_levels),
-            'Dances': random.choice(dance_ranges),
-            'Most': prefs['most'],
-            'Okay': prefs['okay'],
-            'No': prefs['no']
-        })
-    
-    # Generate choreographer preferences
-    choreo_data = []
-    for dance, num_dancers in dances_with_sizes.items():
-        ratings = generate_random_ratings(dancers.copy(), num_dancers)
-        choreo_data.append({
-            'Dance': dance,
-            'NumDancers': num_dancers,
-            'Rating_5': ratings['Rating_5'],
-            'Rating_4': ratings['Rating_4'],
-            'Rating_3': ratings['Rating_3'],
-            'Rating_2': ratings['Rating_2'],
-            'Rating_1': ratings['Rating_1']
-        })
-    
-    # Create DataFrames and save to CSV
-    dancer_df = pd.DataFrame(dancer_data)
-    choreo_df = pd.DataFrame(choreo_data)
-    
-    dancer_df.to_csv('dancer_preferences.csv', index=False)
-    choreo_df.to_csv('choreographer_preferences.csv', index=False)
-    
+    if args.dances is not None:
+        sizes = rng.integers(6, 13, size=args.dances).tolist()
+        dances_with_sizes = {f"dance{j}": size for j, size in enumerate(sizes, start=1)}
+
+    rating_shares = RATING_SHARES
+    if args.rating_shares is not None:
+        rating_shares = dict(zip(range(5, 0, -1), args.rating_shares))
+
+    write_dancer_preferences('dancer_preferences.csv', args.dancers, list(dances_with_sizes), rng,
+                             experience_weights=args.experience_weights, range_weights=args.range_weights)
+    write_choreographer_preferences('choreographer_preferences.csv', dances_with_sizes, args.dancers, rng,
+                                    rating_shares=rating_shares)
+
     print("Generated files saved:")
     print("1. dancer_preferences.csv")
     print("2. choreographer_preferences.csv")
-    
+
     print("\nExample of dancer preferences:")
-    print(dancer_df.head().to_string())
+    print(pd.read_csv('dancer_preferences.csv', nrows=5).to_string())
     print("\nExample of choreographer preferences:")
-    print(choreo_df.head().to_string())
+    print(pd.read_csv('choreographer_preferences.csv', nrows=5).to_string())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import time
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+import numpy as np
+
+import pcdcNEW
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+def start_session(dancers, dances, model, output='.'):
+    """Wrap a solved assignment in a session that single edits can be applied to
+
+    Besides the assignment, the session keeps the shared-dancer counts, the
+    show order (as dance ids) and running totals of every score, so an edit
+    only updates the dancer and dance it touches instead of rescoring the
+    whole show. POST /save writes to the output directory.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        excluded_dancers = pcdcNEW.identify_excluded_dancers(model)
+    values = pcdcNEW.placement_values(model)
+    matrix = pcdcNEW.assignment_matrix(dancers, dances, model)
+    dancer_range, dance_range = pcdcNEW.range_bounds(dancers, dances, model)
+    active = np.ones(len(model['dancer_names']), dtype=bool)
+    active[[dancers[dancer].id for dancer in excluded_dancers]] = False
+    overlap = pcdcNEW.dance_overlap(dances, model)
+    order = pcdcNEW.create_show_order(dances, model, overlap=overlap)
+
+    session = {
+        'dancers': dancers,
+        'dances': dances,
+        'model': model,
+        'output': output,
+        'values': values,
+        'dancer_range': dancer_range,
+        'dance_range': dance_range,
+        'active': active,
+        'overlap': overlap,
+        'order': [model['dance_ids'][dance] for dance in order],
+        'per_dancer': matrix.sum(axis=1),
+        'per_dance': matrix.sum(axis=0),
+        'totals': {
+            'value': int((matrix * values).sum(dtype=np.int64)),
+            'rating': int((matrix * model['ratings']).sum(dtype=np.int64)),
+            'most': int(np.count_nonzero(matrix & model['most'])),
+            'okay': int(np.count_nonzero(matrix & model['okay'] & ~model['most']))
+        }
+    }
+    for i in range(len(active)):
+        add_flags(session, dancer_flags(session, i))
+    for j in range(len(model['dance_names'])):
+        add_flags(session, dance_flags(session, j))
+    return session
+
+def dancer_flags(session, i):
+    """Which per-dancer counts of score_assignments dancer i adds to"""
+    count = session['per_dancer'][i]
+    low, high = session['dancer_range'][i]
+    return {'placed': count > 0,
+            'unassigned': count == 0 and session['active'][i],
+            'under_range': 0 < count < low,
+            'over_range': count > high}
+
+def dance_flags(session, j):
+    """Which per-dance counts of score_assignments dance j adds to"""
+    count = session['per_dance'][j]
+    low, high = session['dance_range'][j]
+    return {'dances_under_min': count < low, 'dances_over_max': count > high}
+
+def add_flags(session, flags, sign=1):
+    """Add (or with sign=-1, take away) a dancer's or dance's flags from the running totals"""
+    totals = session['totals']
+    for name, flag in flags.items():
+        totals[name] = totals.get(name, 0) + sign * int(flag)
+
+def session_scores(session):
+    """The current score_assignments metrics, from the running totals"""
+    totals = session['totals']
+    placements = int(session['per_dance'].sum())
+    share = max(placements, 1)
+    return {
+        'objective': totals['value'] + pcdcNEW.COVERAGE_BONUS * totals['placed'],
+        'placements': placements,
+        'mean_rating': totals['rating'] / share,
+        'most_share': totals['most'] / share,
+        'okay_share': totals['okay'] / share,
+        'other_share': (placements - totals['most'] - totals['okay']) / share,
+        'unassigned': totals['unassigned'],
+        'under_range': totals['under_range'],
+        'over_range': totals['over_range'],
+        'dances_under_min': totals['dances_under_min'],
+        'dances_over_max': totals['dances_over_max']
+    }
+
+def apply_edit(session, dancer, dance, add):
+    """Add a dancer to (or remove them from) a dance and update the totals, overlap and show order
+
+    The caller has already checked the edit is allowed. Only the edited
+    dance's shared-dancer counts change, so the show order is repaired by
+    moving that one dance (see reinsert_dance) rather than reordered.
+    """
+    dancers, dances, model = session['dancers'], session['dances'], session['model']
+    i, j = dancers[dancer].id, dances[dance].id
+    sign = 1 if add else -1
+    add_flags(session, dancer_flags(session, i), -1)
+    add_flags(session, dance_flags(session, j), -1)
+
+    others = [dances[other].id for other in dancers[dancer].current_dances if other != dance]
+    session['overlap'][j, others] += sign
+    session['overlap'][others, j] += sign
+    if add:
+        pcdcNEW.add_assignment(dancer, dance, dancers, dances)
+    else:
+        pcdcNEW.remove_assignment(dancer, dance, dancers, dances)
+    session['per_dancer'][i] += sign
+    session['per_dance'][j] += sign
+
+    totals = session['totals']
+    totals['value'] += sign * int(session['values'][i, j])
+    totals['rating'] += sign * int(model['ratings'][i, j])
+    totals['most'] += sign * int(model['most'][i, j])
+    totals['okay'] += sign * int(model['okay'][i, j] and not model['most'][i, j])
+    add_flags(session, dancer_flags(session, i))
+    add_flags(session, dance_flags(session, j))
+
+    session['order'] = reinsert_dance(session['order'], j, session['overlap'])
+
+def reinsert_dance(order, j, overlap):
+    """Move dance j to the place in the order where it adds the fewest back-to-back shared dancers
+
+    Every gap is priced in one vectorized step; on a tie j stays where it is.
+    """
+    position = order.index(j)
+    rest = np.array(order[:position] + order[position + 1:], dtype=np.int64)
+    if len(rest) == 0:
+        return order
+    added = np.empty(len(rest) + 1, dtype=np.int64)
+    added[0] = overlap[j, rest[0]]
+    added[-1] = overlap[rest[-1], j]
+    added[1:-1] = overlap[rest[:-1], j] + overlap[j, rest[1:]] - overlap[rest[:-1], rest[1:]]
+    best = int(added.argmin())
+    if added[best] >= added[position]:
+        return order
+    return rest[:best].tolist() + [j] + rest[best:].tolist()
+
+def show_order(session):
+    """The current show order as dance names"""
+    return [session['model']['dance_names'][j] for j in session['order']]
+
+def session_state(session):
+    """Scores and show order of the current assignment, as returned by every endpoint"""
+    order = np.asarray(session['order'], dtype=np.int64)
+    return {
+        'scores': session_scores(session),
+        'show_order': show_order(session),
+        'quick_changes': int(session['overlap'][order[:-1], order[1:]].sum())
+    }
+
+def edit(session, request, add):
+    """POST /add and /remove: validate one edit against the assignment rules and apply it"""
+    dancer, dance = request.get('dancer'), request.get('dance')
+    if not isinstance(dancer, str) or not isinstance(dance, str):
+        return 400, {'ok': False, 'reason': 'dancer_and_dance_must_be_strings'}
+    if dancer not in session['dancers'] or dance not in session['dances']:
+        return 404, {'ok': False, 'reason': 'unknown_dancer_or_dance'}
+    dancers, dances, model = session['dancers'], session['dances'], session['model']
+    if add and not pcdcNEW.can_add_dancer(dancer, dance, dancers, dances, model):
+        return 409, {'ok': False, 'reason': pcdcNEW.rejection_reason(dancer, dance, dancers, dances, model)}
+    if not add and dance not in dancers[dancer].current_dances:
+        return 409, {'ok': False, 'reason': 'not_in_dance'}
+    if not add and not pcdcNEW.can_remove_dancer(dancer, dance, dancers, dances, model):
+        return 409, {'ok': False, 'reason': 'required_by'}
+    apply_edit(session, dancer, dance, add)
+    return 200, {'ok': True, **session_state(session)}
+
+def get_assignments(session, request):
+    """GET /assignments: every dance's current dancers"""
+    dances = session['dances']
+    return 200, {dance: list(dances[dance].current_dancers) for dance in dances}
+
+def save(session, request):
+    """POST /save: write the current state with save_results to the session's output directory"""
+    parquet = bool(request.get('parquet', False))
+    if parquet and importlib.util.find_spec('pyarrow') is None:
+        return 400, {'ok': False, 'reason': 'parquet needs pyarrow'}
+    pcdcNEW.save_results(session['dancers'], session['dances'], show_order(session), session['model'],
+                         parquet=parquet, directory=session['output'])
+    return 200, {'ok': True, 'directory': session['output']}
+
+# (method, path) -> handler(session, request JSON) returning (status, response JSON)
+ROUTES = {
+    ('GET', '/state'): lambda session, request: (200, session_state(session)),
+    ('GET', '/assignments'): get_assignments,
+    ('POST', '/add'): lambda session, request: edit(session, request, add=True),
+    ('POST', '/remove'): lambda session, request: edit(session, request, add=False),
+    ('POST', '/save'): save
+}
+
+def route(session, method, path, body):
+    """Dispatch one request and return (status, response JSON), timing the handler"""
+    handler = ROUTES.get((method, path))
+    if handler is None:
+        allowed = any(route_path == path for _, route_path in ROUTES)
+        return (405, {'error': 'method not allowed'}) if allowed else (404, {'error': 'not found'})
+    try:
+        request = json.loads(body) if body else {}
+    except ValueError:
+        return 400, {'error': 'body is not valid JSON'}
+    if not isinstance(request, dict):
+        return 400, {'error': 'body must be a JSON object'}
+    start = time.perf_counter()
+    try:
+        status, response = handler(session, request)
+    except Exception as error:
+        print(f"Warning: {method} {path} failed: {error!r}")
+        return 500, {'error': f'internal error: {error}'}
+    response['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    return status, response
+
+async def handle_connection(reader, writer, session):
+    """Serve one HTTP/1.1 request with a JSON body and a JSON response, then close the connection"""
+    try:
+        method, target, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+        status, response = route(session, method, urlsplit(target).path, body)
+    except (ValueError, asyncio.IncompleteReadError):
+        status, response = 400, {'error': 'malformed request'}
+
+    data = json.dumps(response, ensure_ascii=False).encode('utf-8')
+    writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                 f"Content-Type: application/json; charset=utf-8\r\n"
+                 f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode('latin-1') + data)
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def serve(session, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Serve the session until cancelled; requests are handled one at a time on the event loop"""
+    server = await asyncio.start_server(lambda reader, writer: handle_connection(reader, writer, session), host, port)
+    print(f"Serving on http://{host}:{port} (Ctrl-C to stop)")
+    async with server:
+        await server.serve_forever()
+
+def resume_assignments(dancers, dances, model, path='dance_assignments.csv'):
+    """Re-apply a saved dance_assignments.csv, returning how many of its placements were skipped"""
+    previous = pcdcNEW.read_previous_assignments(path) or []
+    return len(pcdcNEW.keep_previous_assignments(dancers, dances, model, previous))
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Serve a loaded assignment over local HTTP for interactive editing")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('--solver', choices=sorted(pcdcNEW.SOLVERS), default='greedy',
+                        help="assignment engine for the starting assignment (default: greedy)")
+    parser.add_argument('--resume', action='store_true',
+                        help="start from the saved dance_assignments.csv instead of solving")
+    parser.add_argument('--output', default='.', help="directory POST /save writes to (default: current directory)")
+    parser.add_argument('--no-cache', action='store_true', help="re-parse the CSVs instead of using the parse cache")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    dancers, dances, model = pcdcNEW.load_data(None if args.no_cache else pcdcNEW.CACHE_DIR)
+    if args.resume:
+        skipped = resume_assignments(dancers, dances, model)
+        print(f"Resumed the saved assignments ({skipped} placement(s) no longer allowed were skipped)")
+    else:
+        pcdcNEW.SOLVERS[args.solver](dancers, dances, model)
+
+    session = start_session(dancers, dances, model, output=args.output)
+    print(f"Objective: {session_scores(session)['objective']}")
+    try:
+        asyncio.run(serve(session, args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nStopped")
+
+if __name__ == "__main__":
+    main()